@@ -2,21 +2,38 @@ import discord
 from discord.ext import commands
 import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import asyncio
+import atexit
+import bisect
+import codecs
+import collections
+import contextlib
+import functools
+import logging
+import logging.handlers
+import math
+import queue
+import shutil
+import sys
 import random
 import string
+import gzip
+import hashlib
+import heapq
+import io
+import sqlite3
+import threading
+import time
+import types
+import weakref
+import zlib
 from dotenv import load_dotenv
 import os
 
-# Configurações do bot
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-
-bot = commands.Bot(command_prefix='!', intents=intents)
-
 # Configurações (substitua pelos IDs do seu servidor)
+# Os IDs de canais e cargos abaixo são os valores iniciais do servidor GUILD_ID; cada servidor
+# tem sua própria configuração no banco (GUILD_CONFIG_KEYS), alterável com /config_set
 CONFIG = {
     "GUILD_ID": 1390409777305092166,  # ID do seu servidor
     "TICKET_CATEGORY_ID": 1390409779570020420,  # ID da categoria onde os tickets serão criados
@@ -25,12 +42,157 @@ CONFIG = {
     "ROLE_ADMIN_CHANNEL_ID": 1390434044864626728,  # ID do canal onde admins verão solicitações
     "AVAILABLE_ROLES": [  1390409777305092171,# IDs dos cargos disponíveis para solicitação
         # Exemplo: 123456789012345678
-    ]
+    ],
+    "TICKET_POOL_SIZE": 0,  # Canais de ticket ocultos criados com antecedência, por servidor; 0 desativa
+    "TICKET_POOL_REFILL_INTERVAL": 15,  # Segundos entre as criações de canais do pool (evita o limite de taxa)
+    "TICKET_BUFFER_SIZE": 500,  # Mensagens por ticket mantidas em memória; as mais antigas ficam só no banco
+    "TRANSCRIPT_RETENTION_DAYS": 180,  # Dias que os logs de ticket ficam no arquivo; None mantém para sempre
+    "TRANSCRIPT_ARCHIVE_MAX_MB": 1024,  # Tamanho máximo do arquivo de logs; os dias mais antigos são apagados primeiro
+    "AUTO_ROLE_ID": 1390409777305092167,  # ID do cargo dado automaticamente ao entrar no servidor
+    "INITIAL_ROLE_ID": 1390409777305092167,  # ID do cargo inicial, removido quando a solicitação de cargo é aprovada
+    "CONFIG_FILE": "guild_config.json",  # Arquivo com a configuração por servidor, recarregado sem reiniciar o bot
+    "CONFIG_RELOAD_INTERVAL": 5,  # Intervalo (segundos) entre as verificações do arquivo de configuração
+    "AUTO_ROLE_CONCURRENCY": 2,  # Quantos cargos automáticos são aplicados ao mesmo tempo
+    "AUTO_ROLE_QUEUE_SIZE": 5000,  # Tamanho máximo da fila de entradas pendentes
+    "JOB_WORKERS": 4,  # Tarefas lentas (ex.: fechar ticket) executadas ao mesmo tempo
+    "JOB_QUEUE_SIZE": 100,  # Tarefas lentas aguardando na fila
+    "RATE_LIMITS": {  # Limite de cliques por usuário: escopo -> [cliques seguidos, segundos para liberar mais um]
+        "ticket": [2, 30],
+        "role_request": [3, 20],
+        "captcha": [6, 5],
+        "admin": [10, 2],
+    },
+    "DUPLICATE_CLICK_TTL": 300,  # Segundos em que um clique repetido em ação já concluída é respondido pelo cache
+    "REST_SHED_THRESHOLD": 50,  # Requisições REST em andamento a partir das quais novos cliques são recusados
+    "METRICS_PORT": None,  # Porta do endpoint /metrics (formato Prometheus) em 127.0.0.1; None desativa
+    "LOG_LEVELS": {  # Nível de log por subsistema (antlove.tickets, antlove.autorole, antlove.db, discord, ...)
+        "antlove": "INFO",
+        "discord": "INFO",
+    },
+    "LOG_FILE": None,  # Arquivo para os logs em JSON; None escreve no stdout
+    "LOG_QUEUE_SIZE": 10000,  # Registros aguardando escrita; acima disso são descartados
+    "COMMAND_SYNC_GUILDS": [],  # IDs de servidores para sincronizar os comandos na hora (vazio = sincronização global)
+    "LOW_MEMORY_MEMBERS": False,  # Não baixa a lista de membros ao iniciar; guarda só os membros vistos recentemente
+    "MEMBER_CACHE_SIZE": 10000,  # Membros mantidos em memória no modo LOW_MEMORY_MEMBERS
 }
 
+# Configurações do bot
+intents = discord.Intents.default()
+intents.message_content = True
+intents.members = True
+
+if CONFIG["LOW_MEMORY_MEMBERS"]:
+    # Sem chunking na inicialização e sem cache de membros do discord.py (ver MemberCache)
+    member_cache_options = {'chunk_guilds_at_startup': False, 'member_cache_flags': discord.MemberCacheFlags.none()}
+else:
+    member_cache_options = {}
+
+# AutoShardedBot: um único processo atende vários servidores, distribuídos entre shards
+# Sem !help: o bot só tem comandos slash, e sem comandos de prefixo o on_message não chama process_commands
+bot = commands.AutoShardedBot(command_prefix='!', intents=intents, help_command=None, **member_cache_options)
+
+# ========== LOGS ==========
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos estruturados passados em extra="""
+    FIELDS = ('event', 'guild', 'user', 'latency_ms')
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Só coloca o registro na fila; a formatação e a escrita acontecem na thread do QueueListener
+    Com a fila quase cheia, registros abaixo de WARNING são amostrados; com a fila cheia, descartados
+    """
+    def __init__(self, log_queue, sample_rate=10):
+        super().__init__(log_queue)
+        self.high_watermark = int(log_queue.maxsize * 0.8)
+        self.sample_rate = sample_rate
+        self.sample_counter = 0
+        self.dropped = 0
+        self.dropped_total = 0
+    
+    def prepare(self, record):
+        # O traceback precisa virar texto aqui; a mensagem é montada na thread de escrita
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def _drop(self):
+        self.dropped += 1
+        self.dropped_total += 1
+    
+    def enqueue(self, record):
+        size = self.queue.qsize()
+        if size >= self.high_watermark and record.levelno < logging.WARNING:
+            self.sample_counter += 1
+            if self.sample_counter % self.sample_rate:
+                self._drop()
+                return
+        elif self.dropped and size < self.high_watermark // 2:
+            # Pressão passou: registra quantos foram descartados
+            dropped, self.dropped = self.dropped, 0
+            notice = logging.LogRecord('antlove.logs', logging.WARNING, __file__, 0, '%d registro(s) de log descartado(s)', (dropped,), None)
+            notice.event = 'logs_dropped'
+            self.enqueue(notice)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop()
+
+def setup_logging():
+    """Liga os logs do bot e do discord.py na fila com escrita em uma thread separada"""
+    if CONFIG["LOG_FILE"]:
+        output = logging.FileHandler(CONFIG["LOG_FILE"], encoding='utf-8')
+    else:
+        output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    
+    handler = DroppingQueueHandler(queue.Queue(maxsize=CONFIG["LOG_QUEUE_SIZE"]))
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.WARNING)
+    for name, level in CONFIG["LOG_LEVELS"].items():
+        logging.getLogger(name).setLevel(level)
+    return handler
+
+log_handler = setup_logging()
+log = logging.getLogger('antlove')
+db_log = logging.getLogger('antlove.db')
+jobs_log = logging.getLogger('antlove.jobs')
+tickets_log = logging.getLogger('antlove.tickets')
+roles_log = logging.getLogger('antlove.roles')
+autorole_log = logging.getLogger('antlove.autorole')
+warnings_log = logging.getLogger('antlove.warnings')
+handlers_log = logging.getLogger('antlove.handlers')
+
 # Armazenamento de dados dos tickets
+# (as solicitações de cargo ficam em role_requests, no armazenamento persistente)
 tickets_data = {}
-role_requests = {}
+
+# Índice de tickets abertos: (servidor, dono) -> canal e canal -> (servidor, dono)
+# Mantido pelos eventos de canal, evita varrer guild.channels a cada clique
+ticket_owners = {}
+ticket_channels = {}
 
 def is_admin():
     """Verifica se o usuário tem permissões de administrador"""
@@ -38,194 +200,2119 @@ def is_admin():
         return ctx.author.guild_permissions.administrator
     return commands.check(predicate)
 
-def save_ticket_log(ticket_id, messages):
-    """Salva o log do ticket em arquivo"""
-    if not os.path.exists('ticket_logs'):
-        os.makedirs('ticket_logs')
+class TranscriptWriter:
+    """Grava o log do ticket aos poucos; abertura, escrita e fechamento rodam em uma thread"""
+    # Quantidade de linhas acumuladas antes de cada escrita (uma página do histórico)
+    PAGE_SIZE = 100
+    
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.lines = []
+    
+    def _open(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        self.file = open(self.filename, 'w', encoding='utf-8')
+    
+    async def __aenter__(self):
+        await asyncio.to_thread(self._open)
+        return self
+    
+    async def __aexit__(self, *exc):
+        try:
+            await self.flush()
+        finally:
+            await asyncio.to_thread(self.file.close)
     
+    async def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.PAGE_SIZE:
+            await self.flush()
+    
+    async def flush(self):
+        if self.lines:
+            lines, self.lines = self.lines, []
+            await asyncio.to_thread(self.file.writelines, lines)
+
+async def save_ticket_log(ticket_id, messages):
+    """
+    Salva o log do ticket em um arquivo temporário, consumindo as mensagens conforme chegam
+    Depois de enviado e arquivado (transcript_archive), o arquivo temporário é apagado
+    """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"ticket_logs/ticket_{ticket_id}_{timestamp}.txt"
+    filename = f"ticket_logs/tmp/ticket_{ticket_id}_{timestamp}.txt"
+    
+    async with TranscriptWriter(filename) as writer:
+        await writer.write(f"=== LOG DO TICKET #{ticket_id} ===\n")
+        await writer.write(f"Criado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
+        await writer.write("=" * 50 + "\n\n")
+        
+        async for msg in messages:
+            await writer.write(f"[{msg['timestamp']}] {msg['author']}: {msg['content']}\n")
+    
+    return filename
+
+class TranscriptArchive:
+    """
+    Logs de tickets fechados agrupados em um segmento gzip por dia (AAAA-MM-DD.txt.gz)
+    Cada log é um membro gzip independente; o .idx do dia guarda "ticket offset tamanho"
+    para ler um único log com um seek, e `zcat` no segmento mostra todos os logs do dia
+    """
+    def __init__(self, directory, retention_days=None, max_bytes=None):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Chamado com o dia antes de apagar um segmento (remove o dia do índice de busca)
+        self.on_delete = None
+    
+    def _paths(self, day):
+        return os.path.join(self.directory, f'{day}.txt.gz'), os.path.join(self.directory, f'{day}.idx')
+    
+    def append(self, ticket_id, source):
+        """Comprime o log (aos poucos) no fim do segmento do dia; retorna a localização 'dia:offset:tamanho'"""
+        day = datetime.now().strftime('%Y-%m-%d')
+        segment, index = self._paths(day)
+        
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(segment, 'ab') as out:
+                offset = out.tell()
+                with open(source, 'rb') as f, gzip.GzipFile(fileobj=out, mode='wb') as compressed:
+                    shutil.copyfileobj(f, compressed)
+                length = out.tell() - offset
+            with open(index, 'a', encoding='utf-8') as f:
+                f.write(f'{ticket_id} {offset} {length}\n')
+            self.enforce_retention()
+        
+        return f'{day}:{offset}:{length}'
+    
+    def read(self, location):
+        """Lê um único log (bytes) a partir da localização devolvida por append; None se já foi apagado"""
+        day, offset, length = location.split(':')
+        segment, _ = self._paths(day)
+        try:
+            with open(segment, 'rb') as f:
+                f.seek(int(offset))
+                return gzip.decompress(f.read(int(length)))
+        except FileNotFoundError:
+            return None
+    
+    def iter_text(self, location, block_size=65536):
+        """Texto de um único log em blocos de ~block_size terminados em fim de linha, descompactado aos poucos"""
+        day, offset, length = location.split(':')
+        segment, _ = self._paths(day)
+        decompressor = zlib.decompressobj(wbits=31)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = ''
+        
+        def blocks(final=False):
+            nonlocal pending
+            while len(pending) >= block_size or (final and pending):
+                cut = (pending.rfind('\n', 0, block_size) + 1) or block_size
+                block, pending = pending[:cut], pending[cut:]
+                yield block
+        
+        with open(segment, 'rb') as f:
+            f.seek(int(offset))
+            remaining = int(length)
+            while remaining:
+                data = f.read(min(block_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                while data:
+                    pending += decoder.decode(decompressor.decompress(data, block_size))
+                    data = decompressor.unconsumed_tail
+                    yield from blocks()
+        pending += decoder.decode(decompressor.flush(), final=True)
+        yield from blocks(final=True)
+    
+    def days(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len('.txt.gz')] for name in names if name.endswith('.txt.gz'))
+    
+    def enforce_retention(self):
+        """Apaga os segmentos mais antigos que a retenção ou que passam do tamanho máximo"""
+        days = self.days()
+        if self.retention_days is not None:
+            cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+            while days and days[0] < cutoff:
+                self._delete(days.pop(0))
+        
+        if self.max_bytes is not None:
+            sizes = {day: os.path.getsize(self._paths(day)[0]) for day in days}
+            total = sum(sizes.values())
+            # O segmento do dia atual nunca é apagado
+            while len(days) > 1 and total > self.max_bytes:
+                day = days.pop(0)
+                total -= sizes[day]
+                self._delete(day)
+    
+    def _delete(self, day):
+        if self.on_delete is not None:
+            self.on_delete(day)
+        for path in self._paths(day):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        log.info('Segmento de logs %s apagado pela retenção', day, extra={'event': 'transcript_segment_deleted'})
+
+transcript_archive = TranscriptArchive(
+    'ticket_logs/archive',
+    retention_days=CONFIG["TRANSCRIPT_RETENTION_DAYS"],
+    max_bytes=CONFIG["TRANSCRIPT_ARCHIVE_MAX_MB"] * 1024 * 1024 if CONFIG["TRANSCRIPT_ARCHIVE_MAX_MB"] else None
+)
+
+async def archive_transcript(ticket_id, ticket_data, filename):
+    """Arquiva o log do ticket fechado e o coloca no índice de busca (/buscar_ticket)"""
+    location = await asyncio.to_thread(transcript_archive.append, ticket_id, filename)
+    # Indexa lendo o próprio segmento em blocos: o texto não fica em memória nem é copiado para o banco
+    await asyncio.to_thread(
+        database.run, transcript_index.add,
+        ticket_id, ticket_data.get('guild_id'), ticket_data['user_id'], time.time(), location,
+        transcript_archive.iter_text(location)
+    )
+
+def is_transcript_message(message):
+    """Mensagens que entram no log: de usuários ou do bot com embeds"""
+    return not message.author.bot or bool(message.embeds)
+
+def message_record(message):
+    """Converte a mensagem no registro usado no log do ticket"""
+    return {
+        'id': message.id,
+        'timestamp': message.created_at.strftime('%d/%m/%Y %H:%M:%S'),
+        'author': str(message.author),
+        'content': message.content or '[Embed/Anexo]'
+    }
+
+class MessageAuthor:
+    """Autor das mensagens capturadas, compartilhado por todas as mensagens dele"""
+    __slots__ = ('id', 'name', '__weakref__')
+    
+    def __init__(self, author_id, name):
+        self.id = author_id
+        self.name = name
+
+# (ID do autor, nome) -> MessageAuthor; sai daqui quando nenhuma mensagem na memória o usa
+message_authors = weakref.WeakValueDictionary()
+
+def intern_author(author_id, name):
+    """O mesmo autor se repete em quase todas as mensagens do ticket: um único objeto na memória"""
+    key = (author_id, name)
+    author = message_authors.get(key)
+    if author is None:
+        author = message_authors[key] = MessageAuthor(author_id, name)
+    return author
+
+class CapturedMessage:
+    """Mensagem capturada em formato compacto (autor internado pelo ID, horário em segundos)"""
+    __slots__ = ('id', 'created', 'author', 'content')
+    
+    TIME_FORMAT = '%d/%m/%Y %H:%M:%S'
+    
+    def __init__(self, message_id, created, author, content):
+        self.id = message_id
+        self.created = created
+        self.author = author
+        self.content = content
+    
+    @classmethod
+    def from_message(cls, message):
+        author = intern_author(message.author.id, str(message.author))
+        return cls(message.id, int(message.created_at.timestamp()), author, message.content)
+    
+    @classmethod
+    def from_row(cls, row):
+        """Linha da tabela ticket_messages: (message_id, created, author_id, author, content)"""
+        message_id, created, author_id, author, content = row
+        return cls(message_id, created, intern_author(author_id, author), content)
+    
+    def as_record(self):
+        """Registro usado no log do ticket (formatado só na hora de escrever o log)"""
+        return {
+            'id': self.id,
+            'timestamp': datetime.fromtimestamp(self.created, timezone.utc).strftime(self.TIME_FORMAT),
+            'author': self.author.name,
+            'content': self.content or '[Embed/Anexo]'
+        }
+
+class TicketMessageBuffer:
+    """
+    Últimas mensagens de um ticket, com limite de tamanho
+    Todas as mensagens também vão para a tabela ticket_messages; as que saem da memória são lidas de lá
+    """
+    __slots__ = ('messages', 'spilled')
+    
+    def __init__(self, messages=(), spilled=False):
+        self.messages = collections.deque(messages, maxlen=CONFIG["TICKET_BUFFER_SIZE"])
+        # Há mensagens mais antigas só no banco
+        self.spilled = spilled
+    
+    def append(self, captured):
+        if len(self.messages) == self.messages.maxlen:
+            self.spilled = True
+        self.messages.append(captured)
+    
+    def __len__(self):
+        return len(self.messages)
+
+async def iter_captured(ticket_id, buffer, min_id=None, max_id=None):
+    """Mensagens capturadas do ticket com min_id <= id <= max_id: as antigas do banco, depois as da memória"""
+    first_in_memory = buffer.messages[0].id if buffer.messages else None
+    
+    if buffer.spilled and (min_id is None or first_in_memory is None or min_id < first_in_memory):
+        # Garante que as mensagens ainda na fila de gravação estejam no banco antes de ler
+        await database.flush()
+        after = min_id - 1 if min_id is not None else 0
+        before = first_in_memory
+        if max_id is not None and (before is None or max_id < before):
+            before = max_id + 1
+        while True:
+            page = await asyncio.to_thread(database.read, ticket_messages_table.read_range, ticket_id, after, before, 500)
+            for captured in page:
+                yield captured.as_record()
+            if len(page) < 500:
+                break
+            after = page[-1].id
+    
+    for captured in list(buffer.messages):
+        if (min_id is None or captured.id >= min_id) and (max_id is None or captured.id <= max_id):
+            yield captured.as_record()
+
+async def iter_ticket_history(channel, after=None, before=None):
+    """Percorre o histórico do canal sem carregar tudo na memória"""
+    after = discord.Object(id=after) if after else None
+    before = discord.Object(id=before) if before else None
+    async for message in channel.history(limit=None, after=after, before=before, oldest_first=True):
+        if is_transcript_message(message):
+            yield message_record(message)
+
+async def iter_ticket_messages(channel, ticket_data):
+    """
+    Monta o log a partir das mensagens capturadas no on_message
+    Só busca no histórico o trecho perdido (ex.: mensagens enviadas com o bot offline)
+    """
+    ticket_id = str(ticket_data['channel_id'])
+    buffer = ticket_data['messages']
+    if ticket_data.get('synced'):
+        async for record in iter_captured(ticket_id, buffer):
+            yield record
+        return
+    
+    # Tudo até last_message_id foi capturado sem interrupção
+    last_id = ticket_data.get('last_message_id') or 0
+    gap_end = ticket_data.get('gap_end')
+    async for record in iter_captured(ticket_id, buffer, max_id=last_id):
+        yield record
+    
+    async for record in iter_ticket_history(channel, after=last_id, before=gap_end):
+        yield record
+    
+    # Sem gap_end o histórico já trouxe tudo depois de last_message_id
+    if gap_end:
+        async for record in iter_captured(ticket_id, buffer, min_id=gap_end):
+            yield record
+
+# ========== ARMAZENAMENTO PERSISTENTE ==========
+
+# Banco SQLite onde ficam os dados que precisam sobreviver a reinícios
+DATABASE_FILE = 'bot_data.db'
+
+class PersistentTable:
+    """Tabela chave -> JSON com gravação em lote (write-behind)"""
+    def __init__(self, name):
+        self.name = name
+        # Alterações ainda não gravadas: chave -> JSON (ou None para remover)
+        self.pending = {}
+        # Chaves alteradas com frequência: chave -> função que monta o valor, serializado só na gravação
+        self.dirty = {}
+    
+    def create(self, conn):
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {self.name} (key TEXT PRIMARY KEY, data TEXT NOT NULL)')
+    
+    def load(self, conn):
+        """Lê todos os registros da tabela"""
+        return {key: json.loads(data) for key, data in conn.execute(f'SELECT key, data FROM {self.name}')}
+    
+    def put(self, key, value):
+        # Serializa na hora para gravar o estado deste momento
+        self.dirty.pop(str(key), None)
+        self.pending[str(key)] = json.dumps(value, ensure_ascii=False)
+    
+    def put_later(self, key, make_value):
+        """Marca a chave como alterada; make_value(key) monta o valor na próxima gravação"""
+        self.dirty[str(key)] = make_value
+    
+    def delete(self, key):
+        self.dirty.pop(str(key), None)
+        self.pending[str(key)] = None
+    
+    def take_pending(self):
+        for key, make_value in self.dirty.items():
+            self.pending[key] = json.dumps(make_value(key), ensure_ascii=False)
+        self.dirty.clear()
+        batch, self.pending = self.pending, {}
+        return batch
+    
+    def restore(self, batch):
+        """Devolve um lote que não foi gravado; alterações feitas depois prevalecem"""
+        batch.update(self.pending)
+        self.pending = batch
+    
+    def write(self, conn, batch):
+        conn.executemany(
+            f'INSERT INTO {self.name} (key, data) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET data = excluded.data',
+            [(key, data) for key, data in batch.items() if data is not None]
+        )
+        conn.executemany(
+            f'DELETE FROM {self.name} WHERE key = ?',
+            [(key,) for key, data in batch.items() if data is None]
+        )
+
+class MessageLogTable:
+    """Mensagens capturadas (CapturedMessage) por chave, em colunas simples e apenas com inserções em lote (append)"""
+    COLUMNS = 'message_id, created, author_id, author, content'
+    
+    def __init__(self, name):
+        self.name = name
+        self.appends = []
+        self.deletes = set()
+    
+    def create(self, conn):
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.name} '
+            '(key TEXT NOT NULL, message_id INTEGER NOT NULL, created INTEGER NOT NULL, author_id INTEGER NOT NULL, '
+            'author TEXT NOT NULL, content TEXT NOT NULL, PRIMARY KEY (key, message_id))'
+        )
+    
+    def load_tail(self, conn, limit):
+        """Lê só as últimas `limit` mensagens de cada chave, em ordem de ID"""
+        result = {}
+        rows = conn.execute(
+            f'SELECT key, {self.COLUMNS} FROM (SELECT key, {self.COLUMNS}, '
+            f'ROW_NUMBER() OVER (PARTITION BY key ORDER BY message_id DESC) AS position FROM {self.name}) '
+            'WHERE position <= ? ORDER BY key, message_id',
+            (limit,)
+        )
+        for key, *row in rows:
+            result.setdefault(key, []).append(CapturedMessage.from_row(row))
+        return result
+    
+    def read_range(self, conn, key, after, before, limit):
+        """Uma página de mensagens da chave com after < ID < before (before None = sem limite)"""
+        rows = conn.execute(
+            f'SELECT {self.COLUMNS} FROM {self.name} WHERE key = ? AND message_id > ? AND message_id < ? ORDER BY message_id LIMIT ?',
+            (str(key), after, before if before is not None else 2 ** 63 - 1, limit)
+        )
+        return [CapturedMessage.from_row(row) for row in rows]
+    
+    def append(self, key, captured):
+        # Só os valores crus: nada é formatado ou serializado por mensagem
+        self.appends.append((str(key), captured.id, captured.created, captured.author.id, captured.author.name, captured.content))
+    
+    def delete(self, key):
+        key = str(key)
+        self.deletes.add(key)
+        self.appends = [row for row in self.appends if row[0] != key]
+    
+    def take_pending(self):
+        if not self.appends and not self.deletes:
+            return None
+        batch = (self.appends, self.deletes)
+        self.appends, self.deletes = [], set()
+        return batch
+    
+    def restore(self, batch):
+        """Devolve um lote que não foi gravado, antes das alterações feitas depois dele"""
+        appends, deletes = batch
+        # Chaves apagadas depois do lote perdem também as mensagens dele
+        self.appends = [row for row in appends if row[0] not in self.deletes] + self.appends
+        self.deletes = deletes | self.deletes
+    
+    def write(self, conn, batch):
+        appends, deletes = batch
+        conn.executemany(f'DELETE FROM {self.name} WHERE key = ?', [(key,) for key in deletes])
+        conn.executemany(f'INSERT OR IGNORE INTO {self.name} (key, {self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)', appends)
+
+class TranscriptIndexTable:
+    """
+    Índice de texto completo (FTS5) dos logs de tickets fechados
+    O FTS5 é sem conteúdo (content=''): o texto fica só no arquivo de logs (TranscriptArchive)
+    """
+    # Cada log é indexado em blocos; o rowid do bloco é id do log * CHUNKS + número do bloco
+    CHUNKS = 1 << 16
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def create(self, conn):
+        # Metadados em tabela comum (filtros por servidor/usuário/data usam índice) e texto no FTS5, ligados pelo rowid
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.name} '
+            '(id INTEGER PRIMARY KEY, ticket_id TEXT NOT NULL, guild_id INTEGER, user_id INTEGER, '
+            'closed_at INTEGER NOT NULL, filename TEXT NOT NULL)'
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self.name}_guild_user ON {self.name} (guild_id, user_id, closed_at)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self.name}_guild_closed ON {self.name} (guild_id, closed_at)')
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name}_words USING fts5(content, content='', tokenize='unicode61 remove_diacritics 2')"
+        )
+    
+    def take_pending(self):
+        # Nada no lote de gravação: a indexação roda direto com Database.run
+        return None
+    
+    def _index(self, conn, row_id, blocks):
+        conn.executemany(
+            f'INSERT INTO {self.name}_words (rowid, content) VALUES (?, ?)',
+            ((row_id * self.CHUNKS + number, block) for number, block in enumerate(blocks))
+        )
+    
+    def add(self, conn, ticket_id, guild_id, user_id, closed_at, location, blocks):
+        """Registra o log e indexa o texto, bloco a bloco"""
+        cursor = conn.execute(
+            f'INSERT INTO {self.name} (ticket_id, guild_id, user_id, closed_at, filename) VALUES (?, ?, ?, ?, ?)',
+            (str(ticket_id), guild_id, user_id, int(closed_at), location)
+        )
+        self._index(conn, cursor.lastrowid, blocks)
+    
+    @staticmethod
+    def match_query(text):
+        """
+        Cada palavra vira um termo entre aspas, então a busca do usuário nunca é sintaxe FTS5 inválida
+        Texto sem palavras (ex.: só espaços) vira '': quem chama não deve usar MATCH nesse caso
+        """
+        return ' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+    
+    def search(self, conn, guild_id, user_id=None, since=None, until=None, text=None, limit=10):
+        """Tickets fechados que atendem aos filtros: (ticket_id, user_id, closed_at, localização)"""
+        conditions = ['t.guild_id = ?']
+        params = [guild_id]
+        if user_id is not None:
+            conditions.append('t.user_id = ?')
+            params.append(user_id)
+        if since is not None:
+            conditions.append('t.closed_at >= ?')
+            params.append(int(since))
+        if until is not None:
+            conditions.append('t.closed_at < ?')
+            params.append(int(until))
+        
+        query = self.match_query(text or '')
+        if query:
+            # Melhor bloco de cada log define a posição do log no resultado
+            sql = (
+                'SELECT t.ticket_id, t.user_id, t.closed_at, t.filename FROM '
+                f'(SELECT rowid / {self.CHUNKS} AS id, min(rank) AS score FROM {self.name}_words '
+                f'WHERE {self.name}_words MATCH ? GROUP BY rowid / {self.CHUNKS}) m '
+                f'JOIN {self.name} t ON t.id = m.id '
+                'WHERE ' + ' AND '.join(conditions) + ' ORDER BY m.score LIMIT ?'
+            )
+            params = [query] + params
+        else:
+            sql = (
+                f'SELECT t.ticket_id, t.user_id, t.closed_at, t.filename FROM {self.name} t '
+                'WHERE ' + ' AND '.join(conditions) + ' ORDER BY t.closed_at DESC LIMIT ?'
+            )
+        return conn.execute(sql, params + [limit]).fetchall()
+    
+    def delete_day(self, conn, day, read_blocks):
+        """
+        Remove do índice os logs de um segmento do arquivo (retenção), antes de o segmento ser apagado
+        O FTS5 sem conteúdo só remove um bloco recebendo o texto original, relido do segmento por read_blocks
+        """
+        rows = conn.execute(f"SELECT id, filename FROM {self.name} WHERE filename LIKE ? || ':%'", (day,)).fetchall()
+        for row_id, location in rows:
+            try:
+                conn.executemany(
+                    f"INSERT INTO {self.name}_words ({self.name}_words, rowid, content) VALUES ('delete', ?, ?)",
+                    ((row_id * self.CHUNKS + number, block) for number, block in enumerate(read_blocks(location)))
+                )
+            except (OSError, ValueError, zlib.error):
+                db_log.warning('Log %s ilegível; blocos ficam órfãos no índice', location, extra={'event': 'transcript_unindex_failed'})
+            conn.execute(f'DELETE FROM {self.name} WHERE id = ?', (row_id,))
+
+class Database:
+    """Banco SQLite em modo WAL; as gravações são agrupadas e feitas fora do event loop"""
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.conn = None
+        self.tables = []
+        self.lock = threading.Lock()
+        self.flush_task = None
+    
+    def table(self, name, table_class=PersistentTable):
+        table = table_class(name)
+        self.tables.append(table)
+        return table
+    
+    def open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            for table in self.tables:
+                table.create(self.conn)
+    
+    def load(self, table):
+        with self.lock:
+            return table.load(self.conn)
+    
+    def read(self, func, *args, **kwargs):
+        """Executa uma consulta func(conn, ...); chamar via asyncio.to_thread"""
+        with self.lock:
+            return func(self.conn, *args, **kwargs)
+    
+    def run(self, func, *args, **kwargs):
+        """Executa func(conn, ...) em uma transação, fora do lote de gravação; chamar via asyncio.to_thread"""
+        with self.lock, self.conn:
+            return func(self.conn, *args, **kwargs)
+    
+    def _write(self, batches):
+        with self.lock, self.conn:
+            for table, batch in batches:
+                table.write(self.conn, batch)
+    
+    def _take_batches(self):
+        return [(table, batch) for table in self.tables if (batch := table.take_pending())]
+    
+    async def flush(self):
+        """Grava as alterações pendentes em uma thread separada"""
+        batches = self._take_batches()
+        if not batches:
+            return
+        try:
+            await asyncio.to_thread(self._write, batches)
+        except Exception:
+            # A transação foi desfeita: o lote volta para a próxima gravação
+            for table, batch in batches:
+                table.restore(batch)
+            raise
+    
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                db_log.exception('Erro ao gravar dados no banco', extra={'event': 'db_flush_error'})
+    
+    def start(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+    
+    def close(self):
+        """Grava o que estiver pendente e fecha o banco (chamado ao desligar o bot)"""
+        if self.conn is None:
+            return
+        batches = self._take_batches()
+        if batches:
+            self._write(batches)
+        self.conn.close()
+        self.conn = None
+
+database = Database(DATABASE_FILE)
+tickets_table = database.table('tickets')
+ticket_messages_table = database.table('ticket_messages', MessageLogTable)
+transcript_index = database.table('transcripts', TranscriptIndexTable)
+# Segmento apagado pela retenção sai também do índice de busca
+transcript_archive.on_delete = lambda day: database.run(transcript_index.delete_day, day, transcript_archive.iter_text)
+
+def ticket_record(ticket_id):
+    """Dados do ticket gravados no banco (as mensagens vão para ticket_messages)"""
+    return {key: value for key, value in tickets_data[ticket_id].items() if key != 'messages'}
+
+def save_ticket(ticket_id):
+    """Agenda a gravação do ticket no banco"""
+    tickets_table.put(ticket_id, ticket_record(ticket_id))
+
+def forget_ticket(ticket_id):
+    """Remove o ticket da memória e do banco"""
+    tickets_data.pop(ticket_id, None)
+    tickets_table.delete(ticket_id)
+    ticket_messages_table.delete(ticket_id)
+
+def load_tickets():
+    """Reidrata tickets_data a partir do banco"""
+    # Só as últimas mensagens voltam para a memória; o restante é lido do banco ao fechar o ticket
+    limit = CONFIG["TICKET_BUFFER_SIZE"]
+    messages = database.read(ticket_messages_table.load_tail, limit)
+    for ticket_id, data in database.load(tickets_table).items():
+        captured = messages.get(ticket_id, [])
+        data['messages'] = TicketMessageBuffer(captured, spilled=len(captured) >= limit)
+        # A captura foi interrompida pelo reinício
+        data['synced'] = False
+        tickets_data[ticket_id] = data
+
+class RoleRequestRegistry:
+    """Solicitações de cargo pendentes, indexadas por request_id e por user_id e gravadas no banco"""
+    def __init__(self, table):
+        self.table = table
+        self.by_id = {}
+        self.by_user = {}
+    
+    @staticmethod
+    def user_key(data):
+        return (data['guild_id'], data['user_id'])
+    
+    def load(self):
+        for request_id, data in database.load(self.table).items():
+            self.by_id[request_id] = data
+            self.by_user[self.user_key(data)] = request_id
+    
+    def add(self, data):
+        request_id = data['request_id']
+        self.by_id[request_id] = data
+        self.by_user[self.user_key(data)] = request_id
+        self.table.put(request_id, data)
+    
+    def get(self, request_id):
+        return self.by_id.get(request_id)
+    
+    def get_by_user(self, guild_id, user_id):
+        request_id = self.by_user.get((guild_id, user_id))
+        return self.by_id.get(request_id) if request_id else None
+    
+    def remove(self, request_id):
+        data = self.by_id.pop(request_id, None)
+        if data and self.by_user.get(self.user_key(data)) == request_id:
+            del self.by_user[self.user_key(data)]
+        self.table.delete(request_id)
+        return data
+    
+    def __len__(self):
+        return len(self.by_id)
+
+role_requests = RoleRequestRegistry(database.table('role_requests'))
+
+def capture_ticket_message(ticket_id, message):
+    """Guarda a mensagem no buffer do ticket e avança a marca de captura contínua"""
+    ticket_data = tickets_data[ticket_id]
+    captured = CapturedMessage.from_message(message)
+    ticket_data['messages'].append(captured)
+    ticket_messages_table.append(ticket_id, captured)
+    
+    if ticket_data.get('synced'):
+        ticket_data['last_message_id'] = message.id
+    elif not ticket_data.get('gap_end'):
+        # Primeira mensagem depois da interrupção: o trecho perdido termina aqui
+        ticket_data['gap_end'] = message.id
+    # Só marca o ticket: ele é serializado uma vez por gravação, não a cada mensagem
+    tickets_table.put_later(ticket_id, ticket_record)
+
+def mark_tickets_unsynced(guild_ids=None):
+    """Nova sessão do gateway: mensagens podem ter sido perdidas enquanto desconectado"""
+    for ticket_data in tickets_data.values():
+        if guild_ids is not None and ticket_data['guild_id'] not in guild_ids:
+            continue
+        ticket_data['synced'] = False
+        ticket_data['gap_end'] = None
+
+def adopt_open_tickets():
+    """Cria registros para canais de ticket abertos que não estão no banco (ex.: criados antes desta versão)"""
+    for channel_id, (guild_id, owner_id) in ticket_channels.items():
+        ticket_id = str(channel_id)
+        if ticket_id in tickets_data:
+            continue
+        channel = bot.get_channel(channel_id)
+        tickets_data[ticket_id] = {
+            'guild_id': guild_id,
+            'user_id': owner_id,
+            'channel_id': channel_id,
+            'created_at': channel.created_at.isoformat() if channel else datetime.now().isoformat(),
+            'messages': TicketMessageBuffer(),
+            'synced': False,
+            'last_message_id': None,
+            'gap_end': None
+        }
+        save_ticket(ticket_id)
+
+# ========== CONFIGURAÇÃO POR SERVIDOR ==========
+
+# Configurações que cada servidor define separadamente
+GUILD_CONFIG_KEYS = (
+    "TICKET_CATEGORY_ID",
+    "LOGS_CHANNEL_ID",
+    "ROLE_REQUEST_CHANNEL_ID",
+    "ROLE_ADMIN_CHANNEL_ID",
+    "AVAILABLE_ROLES",
+    "AUTO_ROLE_ID",
+    "INITIAL_ROLE_ID",
+)
+
+class GuildConfigStore:
+    """Configuração por servidor em snapshots imutáveis, trocados por inteiro a cada alteração
+    
+    Camadas (a última vence): padrão < arquivo CONFIG_FILE < /config_set (tabela do banco).
+    Os handlers leem get_guild_config() uma vez e recebem um snapshot que nunca muda,
+    então uma interação em andamento não vê uma configuração aplicada pela metade.
+    """
+    
+    def __init__(self, table, filename, interval):
+        self.table = table
+        self.filename = filename
+        self.interval = interval
+        self.stored = {}     # guild_id -> alterações feitas com /config_set
+        self.from_file = {}  # guild_id -> valores do arquivo
+        self.snapshot = {}   # guild_id -> MappingProxyType (só é substituído, nunca alterado)
+        self.file_mtime = None
+        self.task = None
+        self.reloads = 0
+    
+    @staticmethod
+    def default(guild_id):
+        """Servidor sem configuração: tudo desligado, exceto o servidor principal, que usa o CONFIG"""
+        config = {key: None for key in GUILD_CONFIG_KEYS}
+        config["AVAILABLE_ROLES"] = []
+        if guild_id == CONFIG["GUILD_ID"]:
+            config.update({key: CONFIG[key] for key in GUILD_CONFIG_KEYS})
+        return config
+    
+    @staticmethod
+    def clean(data):
+        """Mantém só as chaves conhecidas; listas viram tuplas para o snapshot ser imutável"""
+        config = {}
+        for key, value in data.items():
+            if key not in GUILD_CONFIG_KEYS:
+                continue
+            if key == "AVAILABLE_ROLES":
+                value = tuple(int(role_id) for role_id in value or ())
+            elif value is not None:
+                value = int(value)
+            config[key] = value
+        return config
+    
+    def build(self, guild_id):
+        config = self.default(guild_id)
+        config.update(self.from_file.get(guild_id, {}))
+        config.update(self.stored.get(guild_id, {}))
+        config["AVAILABLE_ROLES"] = tuple(config["AVAILABLE_ROLES"])
+        return types.MappingProxyType(config)
+    
+    def get(self, guild_id):
+        config = self.snapshot.get(guild_id)
+        if config is None:
+            config = self.build(guild_id)
+            self.snapshot = {**self.snapshot, guild_id: config}
+        return config
+    
+    def set(self, guild_id, key, value):
+        changes = {**self.stored.get(guild_id, {}), **self.clean({key: value})}
+        self.stored = {**self.stored, guild_id: changes}
+        self.table.put(guild_id, changes)
+        self.publish()
+        return self.get(guild_id)
+    
+    def publish(self):
+        """Reconstrói todos os snapshots e troca a referência de uma vez"""
+        previous = self.snapshot
+        guild_ids = set(previous) | set(self.stored) | set(self.from_file)
+        self.snapshot = {guild_id: self.build(guild_id) for guild_id in guild_ids}
+        
+        # Categoria de tickets mudou: o índice de tickets abertos precisa ser refeito
+        changed = any(
+            previous.get(guild_id, {}).get("TICKET_CATEGORY_ID") != config["TICKET_CATEGORY_ID"]
+            for guild_id, config in self.snapshot.items()
+            if guild_id in previous
+        )
+        if changed and bot.is_ready():
+            build_ticket_index()
+    
+    def read_file(self):
+        """Lê e valida o arquivo; retorna None se estiver inválido"""
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {int(guild_id): self.clean(values) for guild_id, values in data.get('guilds', {}).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            log.error('Configuração inválida em %s, mantendo a anterior: %s', self.filename, e, extra={'event': 'config_invalid'})
+            return None
+    
+    def file_changed(self):
+        try:
+            mtime = os.stat(self.filename).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.file_mtime:
+            return False
+        self.file_mtime = mtime
+        return True
+    
+    def load(self):
+        self.stored = {int(guild_id): self.clean(data) for guild_id, data in database.load(self.table).items()}
+        if self.file_changed() and self.file_mtime is not None:
+            self.from_file = self.read_file() or {}
+        self.publish()
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._watch())
     
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(f"=== LOG DO TICKET #{ticket_id} ===\n")
-        f.write(f"Criado em: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-        f.write("=" * 50 + "\n\n")
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not await asyncio.to_thread(self.file_changed):
+                continue
+            if self.file_mtime is None:
+                from_file = {}
+            else:
+                from_file = await asyncio.to_thread(self.read_file)
+                if from_file is None:
+                    continue
+            self.from_file = from_file
+            self.publish()
+            self.reloads += 1
+            log.info('Configuração recarregada de %s', self.filename, extra={'event': 'config_reloaded'})
+
+guild_configs = GuildConfigStore(
+    database.table('guild_config'),
+    CONFIG["CONFIG_FILE"],
+    CONFIG["CONFIG_RELOAD_INTERVAL"]
+)
+
+def get_guild_config(guild_id):
+    """Snapshot imutável da configuração do servidor"""
+    return guild_configs.get(guild_id)
+
+def set_guild_config(guild_id, key, value):
+    return guild_configs.set(guild_id, key, value)
+
+def warning_key(guild_id, user_id):
+    """Chave das advertências: o servidor principal mantém a chave antiga (só o ID do usuário)"""
+    if guild_id == CONFIG["GUILD_ID"]:
+        return str(user_id)
+    return f'{guild_id}:{user_id}'
+
+# ========== SINCRONIZAÇÃO DE COMANDOS ==========
+
+# Hash da última árvore de comandos enviada ao Discord: 'global' ou guild_id -> hash
+command_sync_table = database.table('command_sync')
+
+def command_tree_hash(guild=None):
+    """Hash do payload dos comandos; muda só quando nome, opções ou descrições mudam"""
+    payload = sorted(
+        (command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)),
+        key=lambda command: (command.get('type', 1), command['name'])
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+async def sync_command_tree():
+    """Sincroniza os comandos slash apenas quando a árvore mudou desde a última sincronização"""
+    synced_hashes = database.load(command_sync_table)
+    
+    if CONFIG["COMMAND_SYNC_GUILDS"]:
+        # Por servidor: a atualização aparece na hora (a global pode levar até 1 hora)
+        targets = []
+        for guild_id in CONFIG["COMMAND_SYNC_GUILDS"]:
+            guild = discord.Object(id=guild_id)
+            bot.tree.copy_global_to(guild=guild)
+            targets.append((str(guild_id), guild))
+    else:
+        targets = [('global', None)]
+    
+    for key, guild in targets:
+        tree_hash = command_tree_hash(guild)
+        if synced_hashes.get(key) == tree_hash:
+            log.info('Comandos slash sem alterações (%s), sincronização ignorada', key, extra={'event': 'tree_sync_skipped'})
+            continue
+        try:
+            synced = await bot.tree.sync(guild=guild)
+        except Exception:
+            log.exception('Erro ao sincronizar comandos (%s)', key, extra={'event': 'tree_sync_failed'})
+            continue
+        command_sync_table.put(key, tree_hash)
+        log.info('Sincronizados %d comando(s) slash (%s)', len(synced), key, extra={'event': 'tree_synced'})
+
+# ========== CARGA INICIAL ==========
+
+@bot.event
+async def setup_hook():
+    rest_monitor.install(bot.http)
+    logging.getLogger('discord.http').addHandler(RateLimitLogCounter(logging.WARNING))
+    if CONFIG["METRICS_PORT"]:
+        await start_metrics_server(CONFIG["METRICS_PORT"])
+    
+    # Abre o banco e reidrata os dados antes de conectar ao gateway
+    database.open()
+    guild_configs.load()
+    load_tickets()
+    role_requests.load()
+    scheduler.load()
+    database.start()
+    warnings_store.load()
+    auto_role_pipeline.start()
+    job_queue.start()
+    guild_configs.start()
+    ticket_pool.start()
+    scheduler.start()
+    
+    # Views persistentes e botões com ID dinâmico são registrados antes de conectar ao gateway,
+    # assim nenhum clique feito logo após um reinício fica sem resposta
+    bot.add_view(TicketView())
+    bot.add_view(RoleRequestView())
+    bot.add_view(AdminPanelView())
+    bot.add_dynamic_items(CloseTicketButton, ApproveRoleButton, DenyRoleButton)
+    
+    await sync_command_tree()
+    db_log.info('Banco carregado: %d ticket(s) aberto(s), %d solicitação(ões) de cargo', len(tickets_data), len(role_requests), extra={'event': 'db_loaded'})
+
+# ========== FILA DE TAREFAS EM SEGUNDO PLANO ==========
+
+class JobQueue:
+    """
+    Pool limitado de workers para tarefas lentas disparadas por interações
+    O handler responde com defer() na hora e a tarefa informa o progresso por followups
+    """
+    def __init__(self, workers=4, max_queue=100):
+        self.worker_count = workers
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.workers = []
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+    
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+    
+    def submit(self, func, *args, interaction=None):
+        """Enfileira func(*args); retorna False se a fila estiver cheia"""
+        try:
+            self.queue.put_nowait((func, args, interaction))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            return False
+        self.stats['submitted'] += 1
+        return True
+    
+    async def _worker(self):
+        while True:
+            func, args, interaction = await self.queue.get()
+            try:
+                await func(*args)
+                self.stats['completed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                jobs_log.exception('Erro na tarefa %s', func.__name__, extra={'event': 'job_failed'})
+                if interaction:
+                    try:
+                        await interaction.followup.send(f'❌ Erro: {str(e)}', ephemeral=True)
+                    except discord.HTTPException:
+                        pass
+            finally:
+                self.queue.task_done()
+
+job_queue = JobQueue(workers=CONFIG["JOB_WORKERS"], max_queue=CONFIG["JOB_QUEUE_SIZE"])
+
+# ========== AGENDADOR DE AÇÕES ADIADAS ==========
+
+class Scheduler:
+    """
+    Ações adiadas (ex.: apagar canal em 5s) em um heap ordenado pelo horário
+    Cada ação fica gravada no banco; as atrasadas são executadas ao iniciar o bot
+    """
+    def __init__(self, table):
+        self.table = table
+        self.heap = []
+        self.handlers = {}
+        self.counter = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        # Referências das ações em execução (evita que sejam coletadas)
+        self.running = set()
+    
+    def action(self, name):
+        """Registra a função que executa a ação com esse nome"""
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+    
+    def load(self):
+        for job_id, data in database.load(self.table).items():
+            heapq.heappush(self.heap, (data['due'], job_id, data['action'], data['payload']))
+    
+    def schedule(self, delay, action, **payload):
+        """Agenda action(**payload) para daqui a delay segundos"""
+        self.counter += 1
+        job_id = f'{time.time_ns()}_{self.counter}'
+        due = time.time() + delay
+        heapq.heappush(self.heap, (due, job_id, action, payload))
+        self.table.put(job_id, {'due': due, 'action': action, 'payload': payload})
+        # Acorda o loop se esta passou a ser a próxima ação
+        if self.heap[0][1] == job_id:
+            self.wakeup.set()
+        return job_id
+    
+    def __len__(self):
+        return len(self.heap)
+    
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        # Ações reexecutadas na inicialização precisam do cache de canais
+        await bot.wait_until_ready()
+        while True:
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, job_id, action, payload = heapq.heappop(self.heap)
+            task = asyncio.create_task(self._execute(job_id, action, payload))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+    
+    async def _execute(self, job_id, action, payload):
+        try:
+            handler = self.handlers.get(action)
+            if handler is None:
+                jobs_log.error('Ação agendada desconhecida: %s', action, extra={'event': 'scheduled_unknown'})
+                return
+            await handler(**payload)
+        except Exception:
+            jobs_log.exception('Erro na ação agendada %s', action, extra={'event': 'scheduled_failed'})
+        finally:
+            self.table.delete(job_id)
+
+scheduler = Scheduler(database.table('scheduled_actions'))
+
+@scheduler.action('delete_channel')
+async def scheduled_delete_channel(channel_id):
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        return
+    try:
+        await channel.delete()
+    except discord.NotFound:
+        pass
+    unindex_ticket_channel(channel_id)
+
+@scheduler.action('delete_interaction_response')
+async def scheduled_delete_interaction_response(application_id, token):
+    # O token da interação vale por 15 minutos; depois disso a mensagem efêmera some sozinha
+    webhook = discord.Webhook.partial(application_id, token, client=bot)
+    try:
+        await webhook.delete_message('@original')
+    except discord.HTTPException:
+        pass
+
+# ========== MÉTRICAS ==========
+
+class Histogram:
+    """Histograma com buckets fixos (em segundos), no formato do Prometheus"""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    
+    def __init__(self):
+        # Última posição é o bucket +Inf
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """Contadores e histogramas do bot; a formatação só acontece quando o endpoint é lido"""
+    def __init__(self):
+        self.handler_latency = {}
+        self.handler_errors = {}
+        self.rest_requests = {}
+        self.rate_limit_hits = 0
+        self.global_rate_limit_hits = 0
+    
+    def timed(self, name):
+        """Decorator que mede a latência do handler"""
+        histogram = self.handler_latency.get(name)
+        if histogram is None:
+            histogram = self.handler_latency[name] = Histogram()
+        
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    self.handler_errors[name] = self.handler_errors.get(name, 0) + 1
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - start
+                    histogram.observe(elapsed)
+                    if handlers_log.isEnabledFor(logging.DEBUG):
+                        handlers_log.debug('%s', name, extra={'event': 'handler', 'latency_ms': round(elapsed * 1000, 2)})
+            return wrapper
+        return decorator
+    
+    def count_rest(self, route):
+        key = (route.method, route.path)
+        self.rest_requests[key] = self.rest_requests.get(key, 0) + 1
+    
+    def gauges(self):
+        """Valores lidos na hora da coleta"""
+        gauges = {
+            'antlove_tickets_open': len(tickets_data),
+            'antlove_ticket_pool_available': len(ticket_pool),
+            'antlove_ticket_pool_claimed': ticket_pool.stats['claimed'],
+            'antlove_ticket_pool_misses': ticket_pool.stats['misses'],
+            'antlove_ticket_messages_in_memory': sum(len(data['messages']) for data in tickets_data.values()),
+            'antlove_ticket_index_size': len(ticket_channels),
+            'antlove_role_requests_pending': len(role_requests),
+            'antlove_scheduled_actions': len(scheduler),
+            'antlove_auto_role_queue_depth': auto_role_pipeline.queue.qsize(),
+            'antlove_job_queue_depth': job_queue.queue.qsize(),
+            'antlove_rest_in_flight': rest_monitor.in_flight,
+            'antlove_config_reloads': guild_configs.reloads,
+            'antlove_duplicate_clicks_in_progress': button_actions.stats['in_progress'],
+            'antlove_duplicate_clicks_cached': button_actions.stats['cached'],
+            'antlove_member_cache_size': len(member_cache.members),
+            'antlove_member_cache_hits': member_cache.stats['hits'],
+            'antlove_member_cache_misses': member_cache.stats['misses'],
+            'antlove_member_cache_hit_ratio': member_cache.hit_ratio(),
+        }
+        peak_memory = peak_memory_bytes()
+        if peak_memory is not None:
+            gauges['antlove_process_peak_rss_bytes'] = peak_memory
+        if math.isfinite(bot.latency):
+            gauges['antlove_gateway_latency_seconds'] = bot.latency
+        return gauges
+    
+    def render(self):
+        lines = []
+        
+        lines.append('# TYPE antlove_handler_latency_seconds histogram')
+        for name, histogram in self.handler_latency.items():
+            cumulative = 0
+            for bound, count in zip(histogram.BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'antlove_handler_latency_seconds_bucket{{handler="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'antlove_handler_latency_seconds_bucket{{handler="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'antlove_handler_latency_seconds_sum{{handler="{name}"}} {histogram.sum}')
+            lines.append(f'antlove_handler_latency_seconds_count{{handler="{name}"}} {histogram.count}')
+        
+        lines.append('# TYPE antlove_handler_errors_total counter')
+        for name, count in self.handler_errors.items():
+            lines.append(f'antlove_handler_errors_total{{handler="{name}"}} {count}')
+        
+        lines.append('# TYPE antlove_rest_requests_total counter')
+        for (method, path), count in self.rest_requests.items():
+            lines.append(f'antlove_rest_requests_total{{method="{method}",route="{path}"}} {count}')
+        
+        lines.append('# TYPE antlove_rate_limit_hits_total counter')
+        lines.append(f'antlove_rate_limit_hits_total{{scope="route"}} {self.rate_limit_hits}')
+        lines.append(f'antlove_rate_limit_hits_total{{scope="global"}} {self.global_rate_limit_hits}')
+        
+        lines.append('# TYPE antlove_clicks_rejected_total counter')
+        for reason, count in shed_stats.items():
+            lines.append(f'antlove_clicks_rejected_total{{reason="{reason}"}} {count}')
+        
+        lines.append('# TYPE antlove_auto_role_total counter')
+        for key, count in auto_role_pipeline.stats.items():
+            lines.append(f'antlove_auto_role_total{{result="{key}"}} {count}')
+        
+        lines.append('# TYPE antlove_log_records_dropped_total counter')
+        lines.append(f'antlove_log_records_dropped_total {log_handler.dropped_total}')
+        
+        lines.append('# TYPE antlove_jobs_total counter')
+        for key, count in job_queue.stats.items():
+            lines.append(f'antlove_jobs_total{{result="{key}"}} {count}')
+        
+        for name, value in self.gauges().items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class RateLimitLogCounter(logging.Handler):
+    """Conta os avisos de 429 que o discord.py registra ao tratar o rate limit internamente"""
+    def emit(self, record):
+        if record.msg.startswith('We are being rate limited'):
+            metrics.rate_limit_hits += 1
+        elif record.msg.startswith('Global rate limit has been hit'):
+            # Vem logo depois do aviso de 429 do mesmo request (sem await no meio): o 429 era global, não da rota
+            metrics.rate_limit_hits -= 1
+            metrics.global_rate_limit_hits += 1
+
+async def start_metrics_server(port):
+    """Endpoint HTTP local (127.0.0.1) com as métricas em formato texto do Prometheus"""
+    from aiohttp import web
+    
+    async def handle_metrics(_):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+    
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    log.info('Métricas disponíveis em http://127.0.0.1:%d/metrics', port, extra={'event': 'metrics_started'})
+    return runner
+
+# ========== CONTROLE DE TAXA ==========
+
+class TokenBucketLimiter:
+    """
+    Token bucket por usuário: capacity cliques seguidos e uma ficha nova a cada refill_seconds
+    A tabela guarda só [fichas, horário] por usuário e descarta quem ficou parado
+    """
+    # Intervalo entre as limpezas de usuários inativos
+    EVICT_INTERVAL = 60
+    
+    def __init__(self, capacity, refill_seconds):
+        self.capacity = capacity
+        self.rate = 1 / refill_seconds
+        self.buckets = {}
+        self.next_evict = time.monotonic() + self.EVICT_INTERVAL
+    
+    def allow(self, user_id):
+        now = time.monotonic()
+        if now >= self.next_evict:
+            self.evict(now)
+        
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            self.buckets[user_id] = [self.capacity - 1, now]
+            return True
+        
+        tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+    
+    def evict(self, now):
+        """Remove usuários cujo balde já estaria cheio (equivalente a não ter entrada)"""
+        full_after = self.capacity / self.rate
+        self.buckets = {user_id: bucket for user_id, bucket in self.buckets.items() if now - bucket[1] < full_after}
+        self.next_evict = now + self.EVICT_INTERVAL
+
+class RestMonitor:
+    """Conta as requisições REST em andamento (incluindo as que esperam o rate limit)"""
+    def __init__(self):
+        self.in_flight = 0
+        self.installed = False
+    
+    def install(self, http):
+        if self.installed:
+            return
+        original_request = http.request
+        
+        async def request(route, **kwargs):
+            metrics.count_rest(route)
+            self.in_flight += 1
+            try:
+                return await original_request(route, **kwargs)
+            finally:
+                self.in_flight -= 1
+        
+        http.request = request
+        self.installed = True
+
+rest_monitor = RestMonitor()
+rate_limiters = {
+    scope: TokenBucketLimiter(capacity, refill_seconds)
+    for scope, (capacity, refill_seconds) in CONFIG["RATE_LIMITS"].items()
+}
+shed_stats = {'rate_limited': 0, 'shed': 0}
+
+def is_overloaded():
+    """Fila REST ou fila de tarefas saturada"""
+    return rest_monitor.in_flight >= CONFIG["REST_SHED_THRESHOLD"] or job_queue.queue.full()
+
+async def check_rate_limit(interaction, scope):
+    """Responde de forma barata e retorna False se o clique deve ser descartado"""
+    if is_overloaded():
+        shed_stats['shed'] += 1
+        await interaction.response.send_message('⏳ O bot está sobrecarregado, tente novamente em instantes.', ephemeral=True)
+        return False
+    if not rate_limiters[scope].allow(interaction.user.id):
+        shed_stats['rate_limited'] += 1
+        await interaction.response.send_message('⏳ Você está clicando rápido demais! Aguarde alguns segundos.', ephemeral=True)
+        return False
+    return True
+
+class RateLimitedMixin:
+    """Aplica o limite de taxa do escopo rate_limit_scope antes de qualquer callback da view/modal"""
+    rate_limit_scope = 'admin'
+    
+    async def interaction_check(self, interaction: discord.Interaction):
+        return await check_rate_limit(interaction, self.rate_limit_scope)
+
+# ========== AÇÕES IDEMPOTENTES ==========
+
+class IdempotentActions:
+    """
+    Um lock asyncio por chave (ticket, solicitação, usuário) para ações que não podem rodar duas vezes
+    Clique repetido com a ação em andamento ou recém-concluída é respondido sem novas chamadas REST
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        # Chave -> lock da ação em andamento
+        self.locks = {}
+        # Chave -> (expira em, resposta para cliques repetidos)
+        self.results = {}
+        self.stats = {'in_progress': 0, 'cached': 0}
+    
+    def cached_result(self, key):
+        entry = self.results.get(key)
+        if entry is None:
+            return None
+        expires_at, message = entry
+        if expires_at < time.monotonic():
+            del self.results[key]
+            return None
+        return message
+    
+    async def answer_duplicate(self, key, interaction, busy_message):
+        """Responde o clique repetido; retorna True se a interação já foi respondida"""
+        message = self.cached_result(key)
+        if message is not None:
+            self.stats['cached'] += 1
+        elif key in self.locks:
+            self.stats['in_progress'] += 1
+            message = busy_message
+        else:
+            return False
+        await interaction.response.send_message(message, ephemeral=True)
+        return True
+    
+    async def acquire(self, key):
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        await lock.acquire()
+    
+    def release(self, key):
+        lock = self.locks.get(key)
+        if lock is None:
+            return
+        lock.release()
+        if not lock.locked():
+            del self.locks[key]
+    
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+    
+    def remember(self, key, message):
+        """Guarda a resposta dada aos cliques repetidos depois que a ação terminou"""
+        now = time.monotonic()
+        if len(self.results) >= 1000:
+            self.results = {k: entry for k, entry in self.results.items() if entry[0] >= now}
+        self.results[key] = (now + self.ttl, message)
+
+button_actions = IdempotentActions(CONFIG["DUPLICATE_CLICK_TTL"])
+
+# ========== ÍNDICE DE TICKETS ABERTOS ==========
+
+def is_ticket_channel(channel):
+    """Verifica se o canal pertence à categoria de tickets do seu servidor"""
+    if not isinstance(channel, discord.TextChannel) or channel.category_id is None:
+        return False
+    return channel.category_id == get_guild_config(channel.guild.id)["TICKET_CATEGORY_ID"]
+
+def get_ticket_owner_id(channel):
+    """Descobre o dono do ticket pelas permissões do canal (membro que não é o bot)"""
+    for target in channel.overwrites:
+        # Alvos fora do cache vêm como discord.Object com o tipo original em .type
+        if isinstance(target, discord.Role) or getattr(target, 'type', None) is discord.Role:
+            continue
+        if target.id == channel.guild.me.id:
+            continue
+        return target.id
+    return None
+
+def index_ticket_channel(channel, owner_id=None):
+    """Registra o canal no índice de tickets abertos"""
+    if owner_id is None:
+        # O dono gravado no ticket prevalece: a equipe pode adicionar outros membros ao canal
+        ticket_data = tickets_data.get(str(channel.id))
+        owner_id = ticket_data['user_id'] if ticket_data else get_ticket_owner_id(channel)
+    if owner_id is None:
+        return
+    unindex_ticket_channel(channel.id)
+    key = (channel.guild.id, owner_id)
+    ticket_owners[key] = channel.id
+    ticket_channels[channel.id] = key
+
+def unindex_ticket_channel(channel_id):
+    """Remove o canal do índice de tickets abertos"""
+    key = ticket_channels.pop(channel_id, None)
+    if key is not None and ticket_owners.get(key) == channel_id:
+        del ticket_owners[key]
+
+def build_ticket_index(guilds=None):
+    """Monta o índice a partir da categoria de tickets de cada servidor (todos, ou só os informados)"""
+    if guilds is None:
+        guilds = bot.guilds
+        ticket_owners.clear()
+        ticket_channels.clear()
+    else:
+        guild_ids = {guild.id for guild in guilds}
+        for channel_id, key in list(ticket_channels.items()):
+            if key[0] in guild_ids:
+                unindex_ticket_channel(channel_id)
+    
+    for guild in guilds:
+        category = guild.get_channel(get_guild_config(guild.id)["TICKET_CATEGORY_ID"] or 0)
+        if not isinstance(category, discord.CategoryChannel):
+            continue
+        for channel in category.text_channels:
+            index_ticket_channel(channel)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    if is_ticket_channel(channel):
+        index_ticket_channel(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    unindex_ticket_channel(channel.id)
+    ticket_pool.discard(channel.guild.id, channel.id)
+    if str(channel.id) in tickets_data:
+        forget_ticket(str(channel.id))
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    # Canal saiu da categoria ou teve as permissões alteradas
+    if is_ticket_channel(after):
+        if not is_ticket_channel(before) or before.overwrites != after.overwrites:
+            index_ticket_channel(after)
+    else:
+        unindex_ticket_channel(after.id)
+
+# ========== ÍNDICE DE CARGOS ==========
+
+class RoleIndex:
+    """Cargos de um servidor indexados por ID, por nome (sem diferenciar maiúsculas) e cargos de administrador"""
+    def __init__(self, guild):
+        self.by_id = {}
+        self.by_name = {}
+        self.admin_ids = set()
+        for role in guild.roles:
+            self.add(role)
+    
+    def add(self, role):
+        self.by_id[role.id] = role
+        self.by_name.setdefault(role.name.casefold(), set()).add(role.id)
+        if role.permissions.administrator:
+            self.admin_ids.add(role.id)
+    
+    def remove(self, role):
+        old = self.by_id.pop(role.id, None)
+        self.admin_ids.discard(role.id)
+        if old is None:
+            return
+        # O nome guardado pode ser o antigo (cargo renomeado)
+        for name in {old.name.casefold(), role.name.casefold()}:
+            ids = self.by_name.get(name)
+            if ids:
+                ids.discard(role.id)
+                if not ids:
+                    del self.by_name[name]
+    
+    def find(self, text):
+        """Busca por ID ou nome; com nomes repetidos, prefere a grafia exata e depois a menor posição"""
+        if text.isdigit() and int(text) in self.by_id:
+            return self.by_id[int(text)]
+        ids = self.by_name.get(text.casefold())
+        if not ids:
+            return None
+        roles = [self.by_id[role_id] for role_id in ids]
+        return min(roles, key=lambda role: (role.name != text, role.position))
+    
+    def admin_roles(self):
+        return [self.by_id[role_id] for role_id in self.admin_ids]
+
+# Índices por servidor (guild_id -> RoleIndex)
+role_indexes = {}
+
+def get_role_index(guild):
+    index = role_indexes.get(guild.id)
+    if index is None:
+        index = role_indexes[guild.id] = RoleIndex(guild)
+    return index
+
+@bot.event
+async def on_guild_role_create(role):
+    get_role_index(role.guild).add(role)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    index = get_role_index(after.guild)
+    index.remove(before)
+    index.add(after)
+
+@bot.event
+async def on_guild_role_delete(role):
+    get_role_index(role.guild).remove(role)
+
+@bot.event
+async def on_guild_join(guild):
+    role_indexes[guild.id] = RoleIndex(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    role_indexes.pop(guild.id, None)
+
+@bot.event
+async def on_ready():
+    # Os índices são montados em on_shard_ready, que roda antes para cada shard
+    log.info('%s está online! Conectado em %d servidor(s)', bot.user, len(bot.guilds), extra={'event': 'ready'})
+    tickets_log.info('Índice de tickets: %d ticket(s) aberto(s)', len(ticket_channels), extra={'event': 'ticket_index_built'})
+    peak_memory = peak_memory_bytes()
+    log.info(
+        'Pico de memória: %s, %d membro(s) em cache (modo pouca memória: %s)',
+        f'{peak_memory / 1024 / 1024:.1f} MB' if peak_memory is not None else 'indisponível',
+        sum(len(guild.members) for guild in bot.guilds) + len(member_cache.members),
+        'sim' if member_cache.enabled else 'não',
+        extra={'event': 'memory_report'}
+    )
+
+@bot.event
+async def on_shard_ready(shard_id):
+    """
+    Shard conectado com uma sessão nova (na inicialização ou ao reconectar sem RESUME):
+    on_ready só dispara uma vez, então os índices dos servidores do shard são refeitos aqui
+    """
+    guilds = [guild for guild in bot.guilds if guild.shard_id == shard_id]
+    
+    # Monta os índices de cargos
+    for guild in guilds:
+        role_indexes[guild.id] = RoleIndex(guild)
+    
+    # Monta o índice de tickets abertos
+    mark_tickets_unsynced({guild.id for guild in guilds})
+    build_ticket_index(guilds)
+    adopt_open_tickets()
+    ticket_pool.adopt_existing(guilds)
+    log.info('Shard %d pronto: %d servidor(es)', shard_id, len(guilds), extra={'event': 'shard_ready'})
+    
+
+# ========== CACHE DE MEMBROS ==========
+
+class MemberCache:
+    """
+    LRU dos membros vistos recentemente, usado no modo LOW_MEMORY_MEMBERS
+    Procura no cache do discord.py, depois no LRU e, por último, faz fetch_member
+    """
+    def __init__(self, enabled, max_size):
+        self.enabled = enabled
+        self.max_size = max_size
+        # (guild_id, user_id) -> Member, do menos para o mais recente
+        self.members = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+    
+    def remember(self, member):
+        if not self.enabled:
+            return
+        key = (member.guild.id, member.id)
+        self.members[key] = member
+        self.members.move_to_end(key)
+        if len(self.members) > self.max_size:
+            self.members.popitem(last=False)
+            self.stats['evicted'] += 1
+    
+    def discard(self, guild_id, user_id):
+        self.members.pop((guild_id, user_id), None)
+    
+    def get_cached(self, guild, user_id):
+        member = guild.get_member(user_id)
+        if member is None and self.enabled:
+            member = self.members.get((guild.id, user_id))
+            if member is not None:
+                self.members.move_to_end((guild.id, user_id))
+        return member
+    
+    async def get(self, guild, user_id):
+        """Membro do servidor, ou None se ele não estiver mais lá"""
+        member = self.get_cached(guild, user_id)
+        if member is not None:
+            self.stats['hits'] += 1
+            return member
+        
+        self.stats['misses'] += 1
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+        self.remember(member)
+        return member
+    
+    async def fetch_fresh(self, guild, user_id):
+        """
+        Membro com os cargos atuais, para edições que regravam a lista inteira de cargos
+        O LRU não recebe atualizações do gateway, então não é consultado aqui
+        """
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+        try:
+            member = await guild.fetch_member(user_id)
+        except discord.NotFound:
+            return None
+        self.remember(member)
+        return member
+    
+    def hit_ratio(self):
+        total = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / total if total else 1.0
+
+member_cache = MemberCache(CONFIG["LOW_MEMORY_MEMBERS"], CONFIG["MEMBER_CACHE_SIZE"])
+
+def peak_memory_bytes():
+    """Pico de memória residente do processo, ou None onde o módulo resource não existe (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KB no Linux
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+@bot.event
+async def on_interaction(interaction):
+    # Quem clica agora provavelmente vai ser buscado de novo pelos handlers
+    if isinstance(interaction.user, discord.Member):
+        member_cache.remember(interaction.user)
+
+@bot.event
+async def on_raw_member_remove(payload):
+    member_cache.discard(payload.guild_id, payload.user.id)
+
+# ========== SISTEMA DE CARGO AUTOMÁTICO ==========
+
+class AutoRolePipeline:
+    """
+    Fila limitada para o cargo automático
+    Entradas repetidas são agrupadas, a concorrência é limitada e erros 429/5xx são tentados novamente
+    """
+    def __init__(self, concurrency=2, max_queue=5000, max_retries=5):
+        self.concurrency = concurrency
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.max_retries = max_retries
+        # Membros na fila ou em processamento: (guild_id, member_id)
+        self.pending = set()
+        self.workers = []
+        self.wave_started = None
+        self.stats = {'queued': 0, 'coalesced': 0, 'added': 0, 'skipped': 0, 'retries': 0, 'failed': 0}
+    
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+    
+    async def submit(self, member):
+        member_cache.remember(member)
+        key = (member.guild.id, member.id)
+        if key in self.pending:
+            self.stats['coalesced'] += 1
+            return
+        if not self.pending:
+            self.wave_started = asyncio.get_running_loop().time()
+        self.pending.add(key)
+        self.stats['queued'] += 1
+        # Com a fila cheia o evento espera aqui (backpressure) em vez de disparar mais requisições
+        await self.queue.put(key)
+    
+    def metrics(self):
+        return {'queue_depth': self.queue.qsize(), 'pending': len(self.pending), **self.stats}
+    
+    async def _worker(self):
+        while True:
+            key = await self.queue.get()
+            try:
+                await self._process(*key)
+            except Exception:
+                self.stats['failed'] += 1
+                autorole_log.exception('Erro inesperado ao adicionar cargo automático', extra={'event': 'auto_role_error', 'guild': key[0], 'user': key[1]})
+            finally:
+                self.pending.discard(key)
+                self.queue.task_done()
+                if not self.pending and self.wave_started is not None:
+                    elapsed = asyncio.get_running_loop().time() - self.wave_started
+                    self.wave_started = None
+                    autorole_log.info('Fila de cargo automático vazia (%.1fs) - %s', elapsed, self.metrics(), extra={'event': 'auto_role_wave_done', 'latency_ms': round(elapsed * 1000)})
+    
+    async def _process(self, guild_id, member_id):
+        guild = bot.get_guild(guild_id)
+        member = await member_cache.get(guild, member_id) if guild else None
+        if member is None:
+            # Saiu do servidor antes de ser processado
+            self.stats['skipped'] += 1
+            return
+        
+        # Busca o cargo no servidor (servidor sem cargo automático configurado é ignorado)
+        auto_role_id = get_guild_config(guild_id)["AUTO_ROLE_ID"]
+        if not auto_role_id:
+            self.stats['skipped'] += 1
+            return
+        auto_role = guild.get_role(auto_role_id)
+        if not auto_role:
+            self.stats['failed'] += 1
+            autorole_log.error('Cargo automático não encontrado! ID: %s', auto_role_id, extra={'event': 'auto_role_missing', 'guild': guild_id})
+            return
+        
+        if auto_role in member.roles:
+            self.stats['skipped'] += 1
+            return
+        
+        start = time.perf_counter()
+        for attempt in range(self.max_retries):
+            try:
+                await member.add_roles(auto_role, reason='Cargo automático ao entrar no servidor')
+                self.stats['added'] += 1
+                autorole_log.debug(
+                    'Cargo automático adicionado', extra={
+                        'event': 'auto_role_added', 'guild': guild_id, 'user': member_id,
+                        'latency_ms': round((time.perf_counter() - start) * 1000)
+                    }
+                )
+                return
+            except discord.Forbidden:
+                # Bot não tem permissão para adicionar cargos
+                self.stats['failed'] += 1
+                autorole_log.error('Sem permissão para adicionar cargo automático para %s', member.name, extra={'event': 'auto_role_forbidden', 'guild': guild_id, 'user': member_id})
+                return
+            except discord.HTTPException as e:
+                # Rate limit ou erro do Discord: espera e tenta novamente
+                if e.status != 429 and e.status < 500:
+                    self.stats['failed'] += 1
+                    autorole_log.error('Erro HTTP ao adicionar cargo automático: %s', e, extra={'event': 'auto_role_http_error', 'guild': guild_id, 'user': member_id})
+                    return
+                self.stats['retries'] += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
         
-        for msg in messages:
-            f.write(f"[{msg['timestamp']}] {msg['author']}: {msg['content']}\n")
-    
-    return filename
-
-@bot.event
-async def on_ready():
-    print(f'{bot.user} está online!')
-    print(f'Conectado em {len(bot.guilds)} servidor(s)')
-    
-    # Sincroniza comandos slash
-    try:
-        synced = await bot.tree.sync()
-        print(f'Sincronizados {len(synced)} comando(s) slash')
-    except Exception as e:
-        print(f'Erro ao sincronizar comandos: {e}')
-
-    # Registra views persistentes (corrige o erro!)
-    bot.add_view(TicketView())
-    bot.add_view(RoleRequestView())
-    bot.add_view(AdminPanelView())
+        self.stats['failed'] += 1
+        autorole_log.error('Cargo automático não adicionado para %s após %d tentativas', member.name, self.max_retries, extra={'event': 'auto_role_gave_up', 'guild': guild_id, 'user': member_id})
 
-# ========== SISTEMA DE CARGO AUTOMÁTICO ==========
+auto_role_pipeline = AutoRolePipeline(
+    concurrency=CONFIG["AUTO_ROLE_CONCURRENCY"],
+    max_queue=CONFIG["AUTO_ROLE_QUEUE_SIZE"]
+)
 
 @bot.event
 async def on_member_join(member):
     """
     Evento disparado quando um membro entra no servidor
-    Adiciona automaticamente o cargo inicial ao usuário
+    Coloca o membro na fila do cargo automático
     """
-    try:
-        # ID do cargo que será dado automaticamente
-        AUTO_ROLE_ID = 1390409777305092167
-        
-        # Busca o cargo no servidor
-        auto_role = member.guild.get_role(AUTO_ROLE_ID)
-        
-        if auto_role:
-            # Adiciona o cargo ao membro
-            await member.add_roles(auto_role, reason='Cargo automático ao entrar no servidor')
-            
-            # Log opcional - pode ser removido se não quiser spam no console
-            print(f'✅ Cargo automático adicionado para {member.name} ({member.id})')
-            
-        else:
-            # Log de erro se o cargo não for encontrado
-            print(f'❌ Cargo automático não encontrado! ID: {AUTO_ROLE_ID}')
-            
-    except discord.Forbidden:
-        # Bot não tem permissão para adicionar cargos
-        print(f'❌ Sem permissão para adicionar cargo automático para {member.name}')
-        
-    except discord.HTTPException as e:
-        # Erro HTTP do Discord
-        print(f'❌ Erro HTTP ao adicionar cargo automático: {e}')
-        
-    except Exception as e:
-        # Qualquer outro erro
-        print(f'❌ Erro inesperado ao adicionar cargo automático: {e}')
+    await auto_role_pipeline.submit(member)
+
+# ========== POOL DE CANAIS DE TICKET ==========
+
+def ticket_overwrites(guild, user=None):
+    """Permissões de um canal de ticket: oculto para todos, visível para o bot, admins e o dono (se houver)"""
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=False),
+        guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    }
+    if user is not None:
+        overwrites[user] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    
+    # Adiciona permissões para administradores
+    for role in get_role_index(guild).admin_roles():
+        overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+    return overwrites
+
+class TicketChannelPool:
+    """
+    Canais ocultos criados com antecedência na categoria de tickets
+    Criar um ticket passa a ser só liberar o acesso do usuário a um deles; o pool é reposto em segundo plano
+    """
+    NAME = 'ticket-livre'
+    
+    def __init__(self, size, refill_interval):
+        self.size = size
+        self.refill_interval = refill_interval
+        # guild_id -> IDs dos canais livres
+        self.channels = {}
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.stats = {'claimed': 0, 'misses': 0, 'created': 0, 'stale': 0}
+    
+    def __len__(self):
+        return sum(len(channel_ids) for channel_ids in self.channels.values())
+    
+    def is_pool_channel(self, channel):
+        return channel.name == self.NAME and get_ticket_owner_id(channel) is None
+    
+    def adopt_existing(self, guilds=None):
+        """Reaproveita os canais livres que já existiam antes do reinício (ou da reconexão do shard)"""
+        for guild in bot.guilds if guilds is None else guilds:
+            category = guild.get_channel(get_guild_config(guild.id)["TICKET_CATEGORY_ID"] or 0)
+            if isinstance(category, discord.CategoryChannel):
+                self.channels[guild.id] = collections.deque(
+                    channel.id for channel in category.text_channels if self.is_pool_channel(channel)
+                )
+    
+    def discard(self, guild_id, channel_id):
+        """Canal livre apagado fora do bot: sai do pool e a reposição é acordada"""
+        channel_ids = self.channels.get(guild_id)
+        if channel_ids and channel_id in channel_ids:
+            channel_ids.remove(channel_id)
+            self.wakeup.set()
+    
+    def claim(self, guild):
+        """Retira um canal livre do pool (None se estiver vazio)"""
+        channel_ids = self.channels.get(guild.id)
+        category_id = get_guild_config(guild.id)["TICKET_CATEGORY_ID"]
+        admin_ids = {role.id for role in get_role_index(guild).admin_roles()}
+        while channel_ids:
+            # Canal apagado ou movido para fora da categoria desde que entrou no pool
+            channel = guild.get_channel(channel_ids.popleft())
+            if channel is None or channel.category_id != category_id:
+                continue
+            # Cargos de administrador mudaram depois que o canal foi criado: descarta
+            if {target.id for target in channel.overwrites if target.id in admin_ids} != admin_ids:
+                self.stats['stale'] += 1
+                scheduler.schedule(0, 'delete_channel', channel_id=channel.id)
+                continue
+            self.stats['claimed'] += 1
+            self.wakeup.set()
+            return channel
+        self.stats['misses'] += 1
+        self.wakeup.set()
+        return None
+    
+    async def create_channel(self, guild):
+        category = guild.get_channel(get_guild_config(guild.id)["TICKET_CATEGORY_ID"] or 0)
+        if not category:
+            return False
+        channel = await category.create_text_channel(name=self.NAME, overwrites=ticket_overwrites(guild))
+        self.channels.setdefault(guild.id, collections.deque()).append(channel.id)
+        self.stats['created'] += 1
+        return True
+    
+    def start(self):
+        if self.size and self.task is None:
+            self.task = asyncio.create_task(self._refill())
+    
+    async def _refill(self):
+        await bot.wait_until_ready()
+        while True:
+            self.wakeup.clear()
+            created = False
+            for guild in bot.guilds:
+                if len(self.channels.get(guild.id, ())) >= self.size:
+                    continue
+                # Servidor sem categoria de tickets configurada não tem pool
+                if not get_guild_config(guild.id)["TICKET_CATEGORY_ID"]:
+                    continue
+                try:
+                    if not await self.create_channel(guild):
+                        continue
+                    created = True
+                except discord.HTTPException:
+                    tickets_log.exception('Erro ao criar canal do pool de tickets', extra={'event': 'ticket_pool_error', 'guild': guild.id})
+                # Um canal por vez, no ritmo de TICKET_POOL_REFILL_INTERVAL
+                await asyncio.sleep(self.refill_interval)
+            if not created:
+                # Pool cheio: espera um ticket ser criado
+                await self.wakeup.wait()
+
+ticket_pool = TicketChannelPool(CONFIG["TICKET_POOL_SIZE"], CONFIG["TICKET_POOL_REFILL_INTERVAL"])
 
 # ========== SISTEMA DE TICKETS ==========
 
-class TicketView(discord.ui.View):
+class TicketView(RateLimitedMixin, discord.ui.View):
+    rate_limit_scope = 'ticket'
+    
     def __init__(self):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='🎫 Criar Ticket', style=discord.ButtonStyle.primary, custom_id='create_ticket')
+    @metrics.timed('create_ticket')
     async def create_ticket(self, interaction: discord.Interaction, _: discord.ui.Button):
         guild = interaction.guild
         user = interaction.user
         
-        # Verifica se o usuário já tem um ticket aberto
-        # Busca por canais que começam com ticket- e contêm o display name do usuário
-        user_display_name = user.display_name.lower()
-        safe_name = ''.join(c for c in user_display_name if c.isalnum() or c in '-_')
-        safe_name = safe_name[:20] if len(safe_name) > 20 else safe_name
-        
-        existing_ticket = discord.utils.get(guild.channels, name=f'ticket-{safe_name}')
-        # Fallback: busca pelo ID também (caso já exista um ticket com ID)
-        if not existing_ticket:
-            existing_ticket = discord.utils.get(guild.channels, name=f'ticket-{user.id}')
-        
-        if existing_ticket:
-            await interaction.response.send_message('Você já possui um ticket aberto!', ephemeral=True)
-            return
-        
-        # Cria o canal do ticket
-        category = guild.get_channel(CONFIG["TICKET_CATEGORY_ID"])
-        if not category:
-            await interaction.response.send_message('Categoria de tickets não encontrada!', ephemeral=True)
+        # Clique duplo: o segundo clique não pode criar outro canal
+        key = ('create_ticket', guild.id, user.id)
+        if await button_actions.answer_duplicate(key, interaction, '⏳ Seu ticket já está sendo criado, aguarde.'):
             return
         
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        }
-        
-        # Adiciona permissões para administradores
-        for role in guild.roles:
-            if role.permissions.administrator:
-                overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        
-        # Usa o apelido da pessoa no servidor (display_name)
-        # Remove caracteres especiais para nome do canal
-        user_display_name = user.display_name.lower()
-        # Remove caracteres não permitidos em nomes de canais
-        safe_name = ''.join(c for c in user_display_name if c.isalnum() or c in '-_')
-        # Limita o tamanho do nome
-        safe_name = safe_name[:20] if len(safe_name) > 20 else safe_name
-        
-        channel = await category.create_text_channel(
-            name=f'ticket-{safe_name}',
-            overwrites=overwrites
-        )
-        
-        # Inicializa dados do ticket
-        ticket_id = str(channel.id)
-        tickets_data[ticket_id] = {
-            'user_id': user.id,
-            'channel_id': channel.id,
-            'created_at': datetime.now().isoformat(),
-            'messages': []
-        }
-        
-        # Cria embed de boas-vindas
-        embed = discord.Embed(
-            title='🎫 Ticket Criado',
-            description=f'Olá {user.mention}! Seu ticket foi criado com sucesso.\n\nDescreva seu problema ou dúvida que um admistrador da Antlove irá te ajudar em breve.',
-            color=0x00ff00
-        )
-        embed.set_footer(text=f'Ticket ID: {ticket_id}')
-        
-        # Envia mensagem com botões de controle
-        control_view = TicketControlView(ticket_id)
-        await channel.send(embed=embed, view=control_view)
-        
-        await interaction.response.send_message(f'Ticket criado com sucesso! {channel.mention}', ephemeral=True)
+        async with button_actions.hold(key):
+            # Verifica se o usuário já tem um ticket aberto (consulta no índice pelo ID)
+            existing_id = ticket_owners.get((guild.id, user.id))
+            existing_ticket = guild.get_channel(existing_id) if existing_id else None
+            
+            if existing_ticket:
+                await interaction.response.send_message('Você já possui um ticket aberto!', ephemeral=True)
+                return
+            
+            # Cria o canal do ticket
+            category = guild.get_channel(get_guild_config(guild.id)["TICKET_CATEGORY_ID"] or 0)
+            if not category:
+                await interaction.response.send_message('Categoria de tickets não encontrada!', ephemeral=True)
+                return
+            
+            # Usa o apelido da pessoa no servidor (display_name)
+            # Remove caracteres especiais para nome do canal
+            user_display_name = user.display_name.lower()
+            # Remove caracteres não permitidos em nomes de canais
+            safe_name = ''.join(c for c in user_display_name if c.isalnum() or c in '-_')
+            # Limita o tamanho do nome
+            safe_name = safe_name[:20] if len(safe_name) > 20 else safe_name
+            
+            channel = ticket_pool.claim(guild)
+            if channel is not None:
+                # Canal do pool: já tem as permissões de admin, só libera o acesso do usuário
+                await channel.set_permissions(user, read_messages=True, send_messages=True)
+            else:
+                channel = await category.create_text_channel(
+                    name=f'ticket-{safe_name}',
+                    overwrites=ticket_overwrites(guild, user)
+                )
+            index_ticket_channel(channel, owner_id=user.id)
+            
+            # Inicializa dados do ticket
+            ticket_id = str(channel.id)
+            tickets_data[ticket_id] = {
+                'guild_id': guild.id,
+                'user_id': user.id,
+                'channel_id': channel.id,
+                'created_at': datetime.now().isoformat(),
+                'messages': TicketMessageBuffer(),
+                'synced': True,
+                'last_message_id': None,
+                'gap_end': None
+            }
+            save_ticket(ticket_id)
+            tickets_log.info('Ticket %s criado', ticket_id, extra={'event': 'ticket_created', 'guild': guild.id, 'user': user.id})
+            
+            # Cria embed de boas-vindas
+            embed = discord.Embed(
+                title='🎫 Ticket Criado',
+                description=f'Olá {user.mention}! Seu ticket foi criado com sucesso.\n\nDescreva seu problema ou dúvida que um admistrador da Antlove irá te ajudar em breve.',
+                color=0x00ff00
+            )
+            embed.set_footer(text=f'Ticket ID: {ticket_id}')
+            
+            # Envia mensagem com botões de controle
+            control_view = TicketControlView(ticket_id)
+            await channel.send(embed=embed, view=control_view)
+            
+            await interaction.response.send_message(f'Ticket criado com sucesso! {channel.mention}', ephemeral=True)
+            
+            # O nome do canal do pool é trocado depois de responder ao usuário
+            if channel.name != f'ticket-{safe_name}':
+                try:
+                    await channel.edit(name=f'ticket-{safe_name}')
+                except discord.HTTPException:
+                    tickets_log.warning('Não foi possível renomear o ticket %s', ticket_id, extra={'event': 'ticket_rename_failed', 'guild': guild.id})
 
 class TicketControlView(discord.ui.View):
     def __init__(self, ticket_id):
         super().__init__(timeout=None)
         self.ticket_id = ticket_id
+        self.add_item(CloseTicketButton(ticket_id))
+
+class CloseTicketButton(discord.ui.DynamicItem[discord.ui.Button], template=r'close_ticket(?::(?P<ticket_id>[0-9]+))?'):
+    """Botão de fechar ticket com o ID do ticket no custom_id (sobrevive a reinícios)"""
+    def __init__(self, ticket_id):
+        super().__init__(
+            discord.ui.Button(
+                label='🔒 Fechar Ticket',
+                style=discord.ButtonStyle.danger,
+                custom_id=f'close_ticket:{ticket_id}'
+            )
+        )
+        self.ticket_id = ticket_id
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        # Botões antigos usam apenas 'close_ticket': o ID do ticket é o ID do canal
+        return cls(match['ticket_id'] or str(interaction.channel_id))
+    
+    async def callback(self, interaction: discord.Interaction):
+        await self.close_ticket(interaction)
     
-    @discord.ui.button(label='🔒 Fechar Ticket', style=discord.ButtonStyle.danger, custom_id='close_ticket')
-    async def close_ticket(self, interaction: discord.Interaction, _: discord.ui.Button):
+    @metrics.timed('close_ticket')
+    async def close_ticket(self, interaction: discord.Interaction):
         # Verifica se é administrador
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message('Apenas administradores podem fechar tickets!', ephemeral=True)
             return
         
-        channel = interaction.channel
+        key = ('close_ticket', self.ticket_id)
+        if await button_actions.answer_duplicate(key, interaction, '⏳ Este ticket já está sendo fechado.'):
+            return
+        
         ticket_data = tickets_data.get(self.ticket_id)
         
         if not ticket_data:
             await interaction.response.send_message('Dados do ticket não encontrados!', ephemeral=True)
             return
         
-        # Coleta mensagens do canal
-        messages = []
-        async for message in channel.history(limit=None, oldest_first=True):
-            if not message.author.bot or message.embeds:
-                messages.append({
-                    'timestamp': message.created_at.strftime('%d/%m/%Y %H:%M:%S'),
-                    'author': str(message.author),
-                    'content': message.content or '[Embed/Anexo]'
-                })
+        # O lock fica com a tarefa da fila e é liberado ao final de finish_close
+        await button_actions.acquire(key)
         
-        # Salva log
-        log_file = save_ticket_log(self.ticket_id, messages)
+        # Responde na hora; o log e o upload rodam na fila de tarefas
+        try:
+            await interaction.response.defer(thinking=True)
+            submitted = job_queue.submit(self.finish_close, interaction, ticket_data, interaction=interaction)
+        except BaseException:
+            # Interação expirada/desconhecida: libera o ticket para o próximo clique
+            button_actions.release(key)
+            raise
+        if not submitted:
+            button_actions.release(key)
+            await interaction.followup.send('⏳ Muitas tarefas em andamento, tente novamente em instantes.', ephemeral=True)
+    
+    @metrics.timed('close_ticket_job')
+    async def finish_close(self, interaction: discord.Interaction, ticket_data):
+        key = ('close_ticket', self.ticket_id)
+        try:
+            await self.close_and_archive(interaction, ticket_data)
+            button_actions.remember(key, f'Este ticket já foi fechado por {interaction.user.mention}.')
+        finally:
+            button_actions.release(key)
+    
+    async def close_and_archive(self, interaction: discord.Interaction, ticket_data):
+        channel = interaction.channel
+        await interaction.edit_original_response(content='📝 Gerando log do ticket...')
+        
+        # Salva log a partir das mensagens capturadas (busca no histórico só o que faltou)
+        log_file = await save_ticket_log(self.ticket_id, iter_ticket_messages(channel, ticket_data))
+        try:
+            await archive_transcript(self.ticket_id, ticket_data, log_file)
+            await self.send_log(interaction, ticket_data, log_file)
+        finally:
+            await asyncio.to_thread(os.remove, log_file)
+        
+        # Remove dados do ticket
+        forget_ticket(self.ticket_id)
+        tickets_log.info('Ticket %s fechado', self.ticket_id, extra={'event': 'ticket_closed', 'guild': interaction.guild.id, 'user': ticket_data['user_id']})
         
-        # Envia log para canal de logs
-        logs_channel = interaction.guild.get_channel(CONFIG["LOGS_CHANNEL_ID"])
+        await interaction.edit_original_response(content='Ticket será fechado em 5 segundos...')
+        scheduler.schedule(5, 'delete_channel', channel_id=channel.id)
+    
+    async def send_log(self, interaction: discord.Interaction, ticket_data, log_file):
+        """Envia o log para o canal de logs"""
+        logs_channel = interaction.guild.get_channel(get_guild_config(interaction.guild.id)["LOGS_CHANNEL_ID"] or 0)
         if logs_channel:
-            user = interaction.guild.get_member(ticket_data['user_id'])
+            user = await member_cache.get(interaction.guild, ticket_data['user_id'])
             embed = discord.Embed(
                 title='🔒 Ticket Fechado',
                 description=f'**Usuário:** {user.mention if user else "Usuário não encontrado"}\n**Fechado por:** {interaction.user.mention}\n**Data:** {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}',
@@ -233,16 +2320,10 @@ class TicketControlView(discord.ui.View):
             )
             embed.set_footer(text=f'Ticket ID: {self.ticket_id}')
             
-            with open(log_file, 'rb') as f:
+            f = await asyncio.to_thread(open, log_file, 'rb')
+            with f:
                 file = discord.File(f, filename=f'ticket_log_{self.ticket_id}.txt')
                 await logs_channel.send(embed=embed, file=file)
-        
-        # Remove dados do ticket
-        del tickets_data[self.ticket_id]
-        
-        await interaction.response.send_message('Ticket será fechado em 5 segundos...')
-        await asyncio.sleep(5)
-        await channel.delete()
 
 # ========== SISTEMA DE SOLICITAÇÃO DE CARGOS COM CAPTCHA ==========
 
@@ -253,23 +2334,26 @@ import asyncio
 # Dicionário para armazenar captchas pendentes
 pending_captchas = {}
 
-class RoleRequestView(discord.ui.View):
+class RoleRequestView(RateLimitedMixin, discord.ui.View):
+    rate_limit_scope = 'role_request'
+    
     def __init__(self):
         super().__init__(timeout=None)
     
     @discord.ui.button(label='📋 Solicitar Cargo', style=discord.ButtonStyle.secondary, custom_id='request_role')
+    @metrics.timed('request_role')
     async def request_role(self, interaction: discord.Interaction, _: discord.ui.Button):
         user = interaction.user
         guild = interaction.guild
         
         # Verifica se já tem uma solicitação pendente
-        if user.id in role_requests:
+        if role_requests.get_by_user(guild.id, user.id):
             await interaction.response.send_message('Você já possui uma solicitação pendente!', ephemeral=True)
             return
         
         # Cria lista de cargos disponíveis
         available_roles = []
-        for role_id in CONFIG["AVAILABLE_ROLES"]:
+        for role_id in get_guild_config(guild.id)["AVAILABLE_ROLES"]:
             role = guild.get_role(role_id)
             if role:
                 available_roles.append(role)
@@ -289,7 +2373,18 @@ class RoleRequestView(discord.ui.View):
         
         await interaction.response.send_message(embed=embed, view=captcha_view, ephemeral=True)
 
-class CaptchaView(discord.ui.View):
+def schedule_response_deletion(interaction, delay):
+    """Agenda a remoção da resposta original da interação"""
+    scheduler.schedule(
+        delay,
+        'delete_interaction_response',
+        application_id=interaction.application_id,
+        token=interaction.token
+    )
+
+class CaptchaView(RateLimitedMixin, discord.ui.View):
+    rate_limit_scope = 'captcha'
+    
     def __init__(self, available_roles):
         super().__init__(timeout=60)
         self.available_roles = available_roles
@@ -319,22 +2414,15 @@ class CaptchaView(discord.ui.View):
             self.add_item(button)
     
     def create_callback(self, option):
+        @metrics.timed('captcha')
         async def callback(interaction):
             if option == self.captcha_code:
                 # Resposta correta - abre o modal diretamente
                 modal = RoleRequestModal(self.available_roles)
                 await interaction.response.send_modal(modal)
                 
-                # Cria uma task para apagar a mensagem após 5 segundos
-                async def delete_message():
-                    await asyncio.sleep(5)
-                    try:
-                        await interaction.delete_original_response()
-                    except:
-                        pass
-                
-                # Executa a task em segundo plano
-                asyncio.create_task(delete_message())
+                # Agenda a remoção da mensagem após 5 segundos
+                schedule_response_deletion(interaction, 5)
                 
             else:
                 # Resposta incorreta
@@ -346,11 +2434,7 @@ class CaptchaView(discord.ui.View):
                 await interaction.response.edit_message(embed=error_embed, view=None)
                 
                 # Apaga a mensagem após 5 segundos
-                await asyncio.sleep(5)
-                try:
-                    await interaction.delete_original_response()
-                except:
-                    pass
+                schedule_response_deletion(interaction, 5)
         return callback
     
     async def on_timeout(self):
@@ -404,6 +2488,7 @@ class RoleRequestModal(discord.ui.Modal):
         )
         self.add_item(self.role_choice)
     
+    @metrics.timed('RoleRequestModal.on_submit')
     async def on_submit(self, interaction: discord.Interaction):
         try:
             choice = int(self.role_choice.value) - 1
@@ -416,18 +2501,19 @@ class RoleRequestModal(discord.ui.Modal):
             
             # Salva solicitação com os dados separados
             request_id = f"{user.id}_{int(datetime.now().timestamp())}"
-            role_requests[user.id] = {
+            role_requests.add({
                 'request_id': request_id,
+                'guild_id': interaction.guild.id,
                 'user_id': user.id,
                 'role_id': selected_role.id,
                 'recruiter_name': self.recruiter_name.value,
                 'ingame_number': self.ingame_number.value,
                 'rp_name': self.rp_name.value,
                 'timestamp': datetime.now().isoformat()
-            }
+            })
             
             # Envia para canal de administradores
-            admin_channel = interaction.guild.get_channel(CONFIG["ROLE_ADMIN_CHANNEL_ID"])
+            admin_channel = interaction.guild.get_channel(get_guild_config(interaction.guild.id)["ROLE_ADMIN_CHANNEL_ID"] or 0)
             if admin_channel:
                 embed = discord.Embed(
                     title='📋 Nova Solicitação de Cargo',
@@ -449,111 +2535,162 @@ class RoleAdminView(discord.ui.View):
     def __init__(self, request_id):
         super().__init__(timeout=None)
         self.request_id = request_id
+        self.add_item(ApproveRoleButton(request_id))
+        self.add_item(DenyRoleButton(request_id))
+
+def request_id_from_interaction(match, interaction):
+    """ID da solicitação pelo custom_id ou, em botões antigos, pelo rodapé do embed"""
+    if match['request_id']:
+        return match['request_id']
+    for embed in interaction.message.embeds if interaction.message else []:
+        if embed.footer.text and embed.footer.text.startswith('Request ID: '):
+            return embed.footer.text[len('Request ID: '):]
+    return None
+
+class ApproveRoleButton(discord.ui.DynamicItem[discord.ui.Button], template=r'approve_role(?::(?P<request_id>[0-9_]+))?'):
+    def __init__(self, request_id):
+        super().__init__(
+            discord.ui.Button(
+                label='✅ Aprovar',
+                style=discord.ButtonStyle.success,
+                custom_id=f'approve_role:{request_id}'
+            )
+        )
+        self.request_id = request_id
     
-    @discord.ui.button(label='✅ Aprovar', style=discord.ButtonStyle.success, custom_id='approve_role')
-    async def approve_role(self, interaction: discord.Interaction, _: discord.ui.Button):
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(request_id_from_interaction(match, interaction))
+    
+    async def callback(self, interaction: discord.Interaction):
+        await self.approve_role(interaction)
+    
+    @metrics.timed('approve_role')
+    async def approve_role(self, interaction: discord.Interaction):
         if not interaction.user.guild_permissions.administrator:
             await interaction.response.send_message('Apenas administradores podem aprovar solicitações!', ephemeral=True)
             return
         
-        # Encontra a solicitação
-        request_data = None
-        for _, data in role_requests.items():
-            if data['request_id'] == self.request_id:
-                request_data = data
-                break
-        
-        if not request_data:
-            await interaction.response.send_message('Solicitação não encontrada!', ephemeral=True)
-            return
-        
-        user = interaction.guild.get_member(request_data['user_id'])
-        role = interaction.guild.get_role(request_data['role_id'])
-        
-        if not user or not role:
-            await interaction.response.send_message('Usuário ou cargo não encontrado!', ephemeral=True)
+        # Aprovar e reprovar usam a mesma chave: só uma decisão por solicitação
+        key = ('role_request', self.request_id)
+        if await button_actions.answer_duplicate(key, interaction, '⏳ Esta solicitação já está sendo processada.'):
             return
         
-        try:
-            # Adiciona o cargo
-            await user.add_roles(role, reason=f'Aprovado por {interaction.user}')
+        async with button_actions.hold(key):
+            # Encontra a solicitação
+            request_data = role_requests.get(self.request_id)
             
-            # Remove o cargo inicial (ID: 1390409777305092167)
-            initial_role = interaction.guild.get_role(1390409777305092167)
-            if initial_role and initial_role in user.roles:
+            if not request_data:
+                await interaction.response.send_message('Solicitação não encontrada!', ephemeral=True)
+                return
+            
+            # A lista de cargos é regravada inteira: o membro do LRU pode estar desatualizado
+            user = await member_cache.fetch_fresh(interaction.guild, request_data['user_id'])
+            role = interaction.guild.get_role(request_data['role_id'])
+            
+            if not user or not role:
+                await interaction.response.send_message('Usuário ou cargo não encontrado!', ephemeral=True)
+                return
+            
+            try:
+                # Calcula os cargos finais: adiciona o cargo aprovado e remove o cargo inicial
+                initial_role_id = get_guild_config(interaction.guild.id)["INITIAL_ROLE_ID"]
+                new_roles = [r for r in user.roles if not r.is_default() and r.id != initial_role_id and r != role]
+                new_roles.append(role)
+                
+                # Renomeia o usuário com o formato: MEM | NOME DO RP
+                new_nickname = f"MEM | {request_data['rp_name']}"
+                
+                # Aplica cargos e apelido em uma única chamada
+                reason = f'Aprovação de cargo - {interaction.user}'
                 try:
-                    await user.remove_roles(initial_role, reason=f'Cargo inicial removido após aprovação por {interaction.user}')
+                    await user.edit(roles=new_roles, nick=new_nickname, reason=reason)
                 except discord.Forbidden:
-                    # Se não conseguir remover, continua com o processo
+                    # Sem permissão para renomear (ex.: dono do servidor): aplica só os cargos
+                    await user.edit(roles=new_roles, reason=reason)
+                
+                # Remove solicitação
+                role_requests.remove(self.request_id)
+                button_actions.remember(key, f'Esta solicitação já foi aprovada por {interaction.user.mention}.')
+                roles_log.info('Solicitação %s aprovada', self.request_id, extra={'event': 'role_approved', 'guild': interaction.guild.id, 'user': user.id})
+                
+                # Atualiza mensagem
+                embed = discord.Embed(
+                    title='✅ Solicitação Aprovada',
+                    description=f'**Usuário:** {user.mention}\n**Cargo:** {role.mention}\n**Recrutador:** {request_data["recruiter_name"]}\n**Número Ingame:** {request_data["ingame_number"]}\n**Nome No RP:** {request_data["rp_name"]}\n**Novo Nickname:** {new_nickname}\n**Aprovado por:** {interaction.user.mention}',
+                    color=0x00ff00
+                )
+                
+                await interaction.response.edit_message(embed=embed, view=None)
+                
+                # Notifica usuário
+                try:
+                    await user.send(f'Sua solicitação para o cargo **{role.name}** foi aprovada!\nSeu nickname foi alterado para: **{new_nickname}**')
+                except:
                     pass
-            
-            # Renomeia o usuário com o formato: MEM | NOME DO RP
-            new_nickname = f"MEM | {request_data['rp_name']}"
-            try:
-                await user.edit(nick=new_nickname, reason=f'Aprovação de cargo - {interaction.user}')
+                    
             except discord.Forbidden:
-                # Se não conseguir renomear, continua com o processo
-                pass
+                await interaction.response.send_message('Não tenho permissão para adicionar este cargo!', ephemeral=True)
+    
+class DenyRoleButton(discord.ui.DynamicItem[discord.ui.Button], template=r'deny_role(?::(?P<request_id>[0-9_]+))?'):
+    def __init__(self, request_id):
+        super().__init__(
+            discord.ui.Button(
+                label='❌ Reprovar',
+                style=discord.ButtonStyle.danger,
+                custom_id=f'deny_role:{request_id}'
+            )
+        )
+        self.request_id = request_id
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(request_id_from_interaction(match, interaction))
+    
+    async def callback(self, interaction: discord.Interaction):
+        await self.deny_role(interaction)
+    
+    @metrics.timed('deny_role')
+    async def deny_role(self, interaction: discord.Interaction):
+        if not interaction.user.guild_permissions.administrator:
+            await interaction.response.send_message('Apenas administradores podem reprovar solicitações!', ephemeral=True)
+            return
+        
+        key = ('role_request', self.request_id)
+        if await button_actions.answer_duplicate(key, interaction, '⏳ Esta solicitação já está sendo processada.'):
+            return
+        
+        async with button_actions.hold(key):
+            # Encontra a solicitação
+            request_data = role_requests.get(self.request_id)
+            
+            if not request_data:
+                await interaction.response.send_message('Solicitação não encontrada!', ephemeral=True)
+                return
+            
+            user = await member_cache.get(interaction.guild, request_data['user_id'])
+            role = interaction.guild.get_role(request_data['role_id'])
             
             # Remove solicitação
-            del role_requests[request_data['user_id']]
+            role_requests.remove(self.request_id)
+            button_actions.remember(key, f'Esta solicitação já foi reprovada por {interaction.user.mention}.')
+            roles_log.info('Solicitação %s reprovada', self.request_id, extra={'event': 'role_denied', 'guild': interaction.guild.id, 'user': request_data['user_id']})
             
             # Atualiza mensagem
             embed = discord.Embed(
-                title='✅ Solicitação Aprovada',
-                description=f'**Usuário:** {user.mention}\n**Cargo:** {role.mention}\n**Recrutador:** {request_data["recruiter_name"]}\n**Número Ingame:** {request_data["ingame_number"]}\n**Nome No RP:** {request_data["rp_name"]}\n**Novo Nickname:** {new_nickname}\n**Aprovado por:** {interaction.user.mention}',
-                color=0x00ff00
+                title='❌ Solicitação Reprovada',
+                description=f'**Usuário:** {user.mention if user else "Usuário não encontrado"}\n**Cargo:** {role.mention if role else "Cargo não encontrado"}\n**Recrutador:** {request_data.get("recruiter_name", "N/A")}\n**Número Ingame:** {request_data.get("ingame_number", "N/A")}\n**Nome No RP:** {request_data.get("rp_name", "N/A")}\n**Reprovado por:** {interaction.user.mention}',
+                color=0xff0000
             )
             
             await interaction.response.edit_message(embed=embed, view=None)
             
             # Notifica usuário
-            try:
-                await user.send(f'Sua solicitação para o cargo **{role.name}** foi aprovada!\nSeu nickname foi alterado para: **{new_nickname}**')
-            except:
-                pass
-                
-        except discord.Forbidden:
-            await interaction.response.send_message('Não tenho permissão para adicionar este cargo!', ephemeral=True)
-    
-    @discord.ui.button(label='❌ Reprovar', style=discord.ButtonStyle.danger, custom_id='deny_role')
-    async def deny_role(self, interaction: discord.Interaction, _: discord.ui.Button):
-        if not interaction.user.guild_permissions.administrator:
-            await interaction.response.send_message('Apenas administradores podem reprovar solicitações!', ephemeral=True)
-            return
-        
-        # Encontra a solicitação
-        request_data = None
-        for user_id, data in role_requests.items():
-            if data['request_id'] == self.request_id:
-                request_data = data
-                break
-        
-        if not request_data:
-            await interaction.response.send_message('Solicitação não encontrada!', ephemeral=True)
-            return
-        
-        user = interaction.guild.get_member(request_data['user_id'])
-        role = interaction.guild.get_role(request_data['role_id'])
-        
-        # Remove solicitação
-        del role_requests[request_data['user_id']]
-        
-        # Atualiza mensagem
-        embed = discord.Embed(
-            title='❌ Solicitação Reprovada',
-            description=f'**Usuário:** {user.mention if user else "Usuário não encontrado"}\n**Cargo:** {role.mention if role else "Cargo não encontrado"}\n**Recrutador:** {request_data.get("recruiter_name", "N/A")}\n**Número Ingame:** {request_data.get("ingame_number", "N/A")}\n**Nome No RP:** {request_data.get("rp_name", "N/A")}\n**Reprovado por:** {interaction.user.mention}',
-            color=0xff0000
-        )
-        
-        await interaction.response.edit_message(embed=embed, view=None)
-        
-        # Notifica usuário
-        if user:
-            try:
-                await user.send(f'Sua solicitação para o cargo **{role.name if role else "Desconhecido"}** foi reprovada.')
-            except:
-                pass
+            if user:
+                try:
+                    await user.send(f'Sua solicitação para o cargo **{role.name if role else "Desconhecido"}** foi reprovada.')
+                except:
+                    pass
 
 # ========== COMANDOS ==========
 
@@ -601,14 +2738,101 @@ async def config_command(interaction: discord.Interaction):
     
     embed = discord.Embed(title='⚙️ Configuração do Bot', color=0xffd700)
     
-    for key, value in CONFIG.items():
-        if isinstance(value, list):
+    guild_config = get_guild_config(interaction.guild.id)
+    for key, value in guild_config.items():
+        if isinstance(value, (list, tuple)):
             embed.add_field(name=key, value=f'{len(value)} itens configurados', inline=True)
         else:
             embed.add_field(name=key, value=str(value), inline=True)
     
+    embed.set_footer(text=f'Shard {interaction.guild.shard_id} • {len(bot.guilds)} servidor(es)')
+    
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@bot.tree.command(name='config_set', description='Altera uma configuração deste servidor')
+@discord.app_commands.describe(chave='Configuração a alterar', valor='ID (ou IDs separados por vírgula em AVAILABLE_ROLES); vazio desativa')
+@discord.app_commands.choices(chave=[discord.app_commands.Choice(name=key, value=key) for key in GUILD_CONFIG_KEYS])
+async def config_set_command(interaction: discord.Interaction, chave: str, valor: str = ''):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message('Apenas administradores podem usar este comando!', ephemeral=True)
+        return
+    
+    try:
+        ids = [int(part) for part in valor.replace(' ', '').split(',') if part]
+    except ValueError:
+        await interaction.response.send_message('❌ Valor inválido! Use IDs numéricos.', ephemeral=True)
+        return
+    
+    if chave == "AVAILABLE_ROLES":
+        value = ids
+    elif len(ids) > 1:
+        await interaction.response.send_message('❌ Esta configuração aceita apenas um ID!', ephemeral=True)
+        return
+    else:
+        value = ids[0] if ids else None
+    
+    set_guild_config(interaction.guild.id, chave, value)
+    log.info('Configuração %s alterada para %s', chave, value, extra={'event': 'guild_config_set', 'guild': interaction.guild.id, 'user': interaction.user.id})
+    
+    await interaction.response.send_message(f'✅ **{chave}** = `{value}`', ephemeral=True)
+
+def parse_date(value):
+    """Data no formato dd/mm/aaaa (None se vazia); ValueError se inválida"""
+    return datetime.strptime(value.strip(), '%d/%m/%Y') if value else None
+
+@bot.tree.command(name='buscar_ticket', description='Busca nos logs dos tickets fechados')
+@discord.app_commands.describe(
+    usuario='Dono do ticket',
+    texto='Palavras que aparecem no log',
+    de='Fechado a partir de (dd/mm/aaaa)',
+    ate='Fechado até (dd/mm/aaaa)'
+)
+@metrics.timed('buscar_ticket')
+async def search_tickets_command(interaction: discord.Interaction, usuario: discord.User = None, texto: str = None, de: str = None, ate: str = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message('Apenas administradores podem usar este comando!', ephemeral=True)
+        return
+    
+    try:
+        since = parse_date(de)
+        until = parse_date(ate)
+    except ValueError:
+        await interaction.response.send_message('❌ Data inválida! Use o formato dd/mm/aaaa.', ephemeral=True)
+        return
+    
+    # "até" inclui o dia inteiro
+    if until:
+        until += timedelta(days=1)
+    
+    results = await asyncio.to_thread(
+        database.read, transcript_index.search,
+        interaction.guild.id,
+        user_id=usuario.id if usuario else None,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        text=texto
+    )
+    
+    if not results:
+        await interaction.response.send_message('🔍 Nenhum ticket encontrado.', ephemeral=True)
+        return
+    
+    embed = discord.Embed(title='🔍 Tickets encontrados', color=0x0099ff)
+    for ticket_id, user_id, closed_at, _ in results:
+        closed = datetime.fromtimestamp(closed_at).strftime('%d/%m/%Y %H:%M')
+        embed.add_field(name=f'Ticket #{ticket_id}', value=f'**Usuário:** <@{user_id}>\n**Fechado em:** {closed}', inline=False)
+    
+    # Reenvia o log do primeiro resultado direto do arquivo de logs (um seek no segmento do dia)
+    best_ticket_id, location = results[0][0], results[0][3]
+    content = await asyncio.to_thread(transcript_archive.read, location)
+    if content is None:
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+    file = discord.File(io.BytesIO(content), filename=f'ticket_log_{best_ticket_id}.txt')
+    embed.set_footer(text=f'Log anexado: ticket #{best_ticket_id}')
+    
+    await interaction.response.send_message(embed=embed, file=file, ephemeral=True)
+
 # ========== SISTEMA DE PAINEL DE ADMINISTRAÇÃO ==========
 
 import discord
@@ -617,30 +2841,132 @@ import json
 import os
 from datetime import datetime
 
-# Arquivo para salvar advertências
+# Arquivo para salvar advertências (snapshot compactado) e journal com as alterações
 WARNINGS_FILE = 'warnings.json'
+WARNINGS_JOURNAL_FILE = 'warnings.journal'
 
-def load_warnings():
-    """Carrega as advertências do arquivo JSON"""
-    if os.path.exists(WARNINGS_FILE):
-        try:
-            with open(WARNINGS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
-
-def save_warnings(warnings):
-    """Salva as advertências no arquivo JSON"""
-    try:
-        with open(WARNINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(warnings, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        print(f"Erro ao salvar advertências: {e}")
+class WarningsStore:
+    """
+    Advertências indexadas por usuário em memória
+    Cada alteração é anexada ao journal; de tempos em tempos o estado é compactado no snapshot
+    """
+    def __init__(self, snapshot_file, journal_file, compact_every=500):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.compact_every = compact_every
+        self.warnings = {}
+        self.seq = 0
+        self.journal_entries = 0
+        self.lock = asyncio.Lock()
+    
+    def load(self):
+        """Carrega o snapshot e reaplica o journal"""
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Formato antigo: apenas {user_id: [advertências]}
+                if 'warnings' in data:
+                    snapshot_seq = data.get('seq', 0)
+                    data = data['warnings']
+                self.warnings = {user_id: items for user_id, items in data.items() if items}
+            except Exception as e:
+                warnings_log.error('Erro ao carregar advertências: %s', e, extra={'event': 'warnings_load_failed'})
+        
+        self.seq = snapshot_seq
+        self.journal_entries = 0
+        if os.path.exists(self.journal_file):
+            # Fim da última linha completa do journal
+            good_end = 0
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    try:
+                        # Sem '\n' a escrita foi interrompida no meio
+                        if not line.endswith(b'\n'):
+                            raise ValueError
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Última linha incompleta (processo morreu no meio da escrita)
+                        break
+                    good_end += len(line)
+                    self.journal_entries += 1
+                    if entry['seq'] <= snapshot_seq:
+                        continue
+                    self._apply(entry)
+                    self.seq = entry['seq']
+            
+            # Corta a linha incompleta: senão a próxima entrada seria anexada a ela e se perderia no reinício
+            if good_end < os.path.getsize(self.journal_file):
+                warnings_log.warning('Linha incompleta no fim do journal de advertências descartada', extra={'event': 'warnings_journal_truncated'})
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(good_end)
+                    os.fsync(f.fileno())
+    
+    def _apply(self, entry):
+        user_id = entry['user_id']
+        if entry['op'] == 'add':
+            self.warnings.setdefault(user_id, []).append(entry['warning'])
+        elif entry['op'] == 'remove' and self.warnings.get(user_id):
+            self.warnings[user_id].pop()
+            if not self.warnings[user_id]:
+                del self.warnings[user_id]
+    
+    def count(self, user_id):
+        return len(self.warnings.get(user_id, ()))
+    
+    def get(self, user_id):
+        return list(self.warnings.get(user_id, ()))
+    
+    def _write_line(self, line):
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    
+    async def _commit(self, entry):
+        """Grava a alteração no journal (fora do event loop) e só então aplica em memória"""
+        async with self.lock:
+            entry['seq'] = self.seq + 1
+            await asyncio.to_thread(self._write_line, json.dumps(entry, ensure_ascii=False))
+            self.seq = entry['seq']
+            self._apply(entry)
+            self.journal_entries += 1
+            if self.journal_entries >= self.compact_every:
+                await self._compact()
+    
+    async def add(self, user_id, warning):
+        await self._commit({'op': 'add', 'user_id': user_id, 'warning': warning})
+        return self.count(user_id)
+    
+    async def remove(self, user_id):
+        """Remove a advertência mais recente; retorna False se o usuário não tiver nenhuma"""
+        if not self.count(user_id):
+            return False
+        await self._commit({'op': 'remove', 'user_id': user_id})
+        return True
+    
+    def _write_snapshot(self, data):
+        # Escreve em arquivo temporário e troca de forma atômica
+        tmp_file = self.snapshot_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+        # Entradas do journal já estão no snapshot (seq <= data['seq'])
+        open(self.journal_file, 'w').close()
+    
+    async def _compact(self):
+        data = {'seq': self.seq, 'warnings': {user_id: list(items) for user_id, items in self.warnings.items()}}
+        await asyncio.to_thread(self._write_snapshot, data)
+        self.journal_entries = 0
+
+warnings_store = WarningsStore(WARNINGS_FILE, WARNINGS_JOURNAL_FILE)
 
 # ========== MODAIS ==========
 
-class BanModal(discord.ui.Modal):
+class BanModal(RateLimitedMixin, discord.ui.Modal):
     def __init__(self):
         super().__init__(title="Sistema de Banimento")
         
@@ -670,6 +2996,7 @@ class BanModal(discord.ui.Modal):
         self.add_item(self.reason_input)
         self.add_item(self.action_input)
     
+    @metrics.timed('BanModal.on_submit')
     async def on_submit(self, interaction: discord.Interaction):
         user_id = self.user_input.value.replace('<', '').replace('>', '').replace('@', '').replace('!', '')
         reason = self.reason_input.value or "Não especificado"
@@ -706,7 +3033,7 @@ class BanModal(discord.ui.Modal):
         except Exception as e:
             await interaction.response.send_message(f"❌ Erro: {str(e)}", ephemeral=True)
 
-class RoleModal(discord.ui.Modal):
+class RoleModal(RateLimitedMixin, discord.ui.Modal):
     def __init__(self):
         super().__init__(title="Gerenciamento de Cargos")
         
@@ -735,6 +3062,7 @@ class RoleModal(discord.ui.Modal):
         self.add_item(self.role_input)
         self.add_item(self.action_input)
     
+    @metrics.timed('RoleModal.on_submit')
     async def on_submit(self, interaction: discord.Interaction):
         user_id = self.user_input.value.replace('<', '').replace('>', '').replace('@', '').replace('!', '')
         role_name = self.role_input.value
@@ -742,7 +3070,7 @@ class RoleModal(discord.ui.Modal):
         
         try:
             member = await interaction.guild.fetch_member(int(user_id))
-            role = discord.utils.get(interaction.guild.roles, name=role_name) or discord.utils.get(interaction.guild.roles, id=int(role_name) if role_name.isdigit() else None)
+            role = get_role_index(interaction.guild).find(role_name.strip())
             
             if not role:
                 await interaction.response.send_message("❌ Cargo não encontrado!", ephemeral=True)
@@ -774,7 +3102,7 @@ class RoleModal(discord.ui.Modal):
         except Exception as e:
             await interaction.response.send_message(f"❌ Erro: {str(e)}", ephemeral=True)
 
-class WarningModal(discord.ui.Modal):
+class WarningModal(RateLimitedMixin, discord.ui.Modal):
     def __init__(self):
         super().__init__(title="Sistema de Advertências")
         
@@ -804,6 +3132,7 @@ class WarningModal(discord.ui.Modal):
         self.add_item(self.reason_input)
         self.add_item(self.action_input)
     
+    @metrics.timed('WarningModal.on_submit')
     async def on_submit(self, interaction: discord.Interaction):
         user_id = self.user_input.value.replace('<', '').replace('>', '').replace('@', '').replace('!', '')
         reason = self.reason_input.value or "Não especificado"
@@ -811,34 +3140,27 @@ class WarningModal(discord.ui.Modal):
         
         try:
             member = await interaction.guild.fetch_member(int(user_id))
-            warnings = load_warnings()
-            
-            if user_id not in warnings:
-                warnings[user_id] = []
+            user_id = warning_key(interaction.guild.id, member.id)
             
             if action == "add":
-                warnings[user_id].append({
+                total = await warnings_store.add(user_id, {
                     'reason': reason,
                     'moderator': str(interaction.user.id),
                     'date': datetime.now().isoformat()
                 })
-                save_warnings(warnings)
                 
                 embed = discord.Embed(
                     title="⚠️ Advertência Adicionada",
-                    description=f"**Usuário:** {member.mention}\n**Motivo:** {reason}\n**Total:** {len(warnings[user_id])} advertências",
+                    description=f"**Usuário:** {member.mention}\n**Motivo:** {reason}\n**Total:** {total} advertências",
                     color=0xffff00,
                     timestamp=datetime.now()
                 )
                 
             elif action == "remove":
-                if warnings[user_id]:
-                    warnings[user_id].pop()
-                    save_warnings(warnings)
-                    
+                if await warnings_store.remove(user_id):
                     embed = discord.Embed(
                         title="✅ Advertência Removida",
-                        description=f"**Usuário:** {member.mention}\n**Advertências restantes:** {len(warnings[user_id])}",
+                        description=f"**Usuário:** {member.mention}\n**Advertências restantes:** {warnings_store.count(user_id)}",
                         color=0x00ff00,
                         timestamp=datetime.now()
                     )
@@ -847,7 +3169,7 @@ class WarningModal(discord.ui.Modal):
                     return
                     
             elif action == "view":
-                user_warnings = warnings.get(user_id, [])
+                user_warnings = warnings_store.get(user_id)
                 
                 embed = discord.Embed(
                     title=f"📋 Advertências de {member.display_name}",
@@ -875,7 +3197,7 @@ class WarningModal(discord.ui.Modal):
         except Exception as e:
             await interaction.response.send_message(f"❌ Erro: {str(e)}", ephemeral=True)
 
-class EmbedModal(discord.ui.Modal):
+class EmbedModal(RateLimitedMixin, discord.ui.Modal):
     def __init__(self):
         super().__init__(title="Criador de Embed")
         
@@ -922,6 +3244,7 @@ class EmbedModal(discord.ui.Modal):
         self.add_item(self.footer_input)
         self.add_item(self.image_input)
     
+    @metrics.timed('EmbedModal.on_submit')
     async def on_submit(self, interaction: discord.Interaction):
         embed = discord.Embed(color=0x0099ff, timestamp=datetime.now())
         
@@ -952,7 +3275,7 @@ class EmbedModal(discord.ui.Modal):
 
 # ========== VIEW DO PAINEL ==========
 
-class AdminPanelView(discord.ui.View):
+class AdminPanelView(RateLimitedMixin, discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)  # Necessário para persistência
 
@@ -1068,8 +3391,7 @@ async def view_warnings(interaction: discord.Interaction, usuario: discord.Membe
         await interaction.response.send_message('❌ Você não tem permissão para usar este comando!', ephemeral=True)
         return
     
-    warnings = load_warnings()
-    user_warnings = warnings.get(str(usuario.id), [])
+    user_warnings = warnings_store.get(warning_key(interaction.guild.id, usuario.id))
     
     embed = discord.Embed(
         title=f'📋 Advertências de {usuario.display_name}',
@@ -1136,24 +3458,22 @@ async def unban_user(interaction: discord.Interaction, user_id: str, motivo: str
     except Exception as e:
         await interaction.response.send_message(f'❌ Erro ao desbanir usuário: {str(e)}', ephemeral=True)
 
-print("✅ Sistema de Painel de Administração carregado com sucesso!")
+log.info('Sistema de Painel de Administração carregado com sucesso!', extra={'event': 'admin_panel_loaded'})
 
 # ========== EVENTOS ==========
 
 @bot.event
 async def on_message(message):
-    if message.author.bot:
-        return
-    
-    # Salva mensagens em tickets
-    if message.channel.name and message.channel.name.startswith('ticket-'):
+    # Salva mensagens em tickets (inclui embeds do bot, como no log)
+    # Consulta O(1) no índice de tickets abertos; canais comuns e DMs nunca estão nele
+    if message.channel.id in ticket_channels:
         ticket_id = str(message.channel.id)
-        if ticket_id in tickets_data:
-            tickets_data[ticket_id]['messages'].append({
-                'timestamp': message.created_at.isoformat(),
-                'author': str(message.author),
-                'content': message.content
-            })
+        if ticket_id in tickets_data and is_transcript_message(message):
+            capture_ticket_message(ticket_id, message)
+    
+    # Sem comandos de prefixo registrados não há o que processar
+    if message.author.bot or not bot.all_commands:
+        return
     
     await bot.process_commands(message)
 
@@ -1172,5 +3492,10 @@ if __name__ == '__main__':
     if not TOKEN:
         raise RuntimeError("⚠️  DISCORD_TOKEN não encontrado no .env!")
 
-    print("🚀 Iniciando bot...")
-    bot.run(TOKEN)
+    log.info('Iniciando bot...', extra={'event': 'starting'})
+    try:
+        # Os logs do discord.py já passam pela fila configurada em setup_logging
+        bot.run(TOKEN, log_handler=None)
+    finally:
+        # Garante que as alterações pendentes sejam gravadas
+        database.close()
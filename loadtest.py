@@ -0,0 +1,532 @@
+"""
+Simulador offline do Discord e teste de carga do bot
+
+Cria um servidor falso (canais, cargos e membros configurados em CONFIG) e roda com N usuários
+simultâneos os fluxos de ticket (criar/fechar), captcha + solicitação de cargo, aprovação/reprovação
+e advertências, chamando os mesmos handlers do bot.py. Nenhuma requisição chega à API do Discord.
+
+Uso:
+    python loadtest.py --users 200 --messages 20 --rest-latency 20
+    python loadtest.py --flows ticket --bench-messages 100000
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import bot as antlove
+
+# IDs no formato de snowflake
+next_id = itertools.count(1400000000000000000).__next__
+APPLICATION_ID = next_id()
+
+# ========== REST SIMULADO ==========
+
+class SimulatedRest:
+    """Conta as chamadas REST por fluxo e simula a latência da API"""
+    def __init__(self, latency):
+        self.latency = latency
+        self.flow = None
+        self.calls = {}
+
+    async def call(self, route):
+        routes = self.calls.setdefault(self.flow, {})
+        routes[route] = routes.get(route, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def total(self, flow):
+        return sum(self.calls.get(flow, {}).values())
+
+rest = SimulatedRest(0)
+
+# ========== OBJETOS FALSOS ==========
+
+class FakePermissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+        self.moderate_members = administrator
+        self.ban_members = administrator
+
+class FakeRole:
+    def __init__(self, guild, role_id, name, administrator=False, position=0):
+        self.guild = guild
+        self.id = role_id
+        self.name = name
+        self.permissions = FakePermissions(administrator)
+        self.position = position
+
+    @property
+    def mention(self):
+        return f'<@&{self.id}>'
+
+    def is_default(self):
+        return self.id == self.guild.id
+
+class FakeMember:
+    def __init__(self, guild, member_id, name, roles=(), administrator=False):
+        self.guild = guild
+        self.id = member_id
+        self.name = name
+        self.display_name = name
+        self.nick = None
+        self.bot = False
+        self.avatar = None
+        self.roles = [guild.default_role, *roles]
+        self.guild_permissions = FakePermissions(administrator)
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    def __str__(self):
+        return self.name
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await rest.call('PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}')
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await rest.call('DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}')
+            if role in self.roles:
+                self.roles.remove(role)
+
+    async def edit(self, *, roles=None, nick=None, reason=None):
+        await rest.call('PATCH /guilds/{guild_id}/members/{user_id}')
+        if roles is not None:
+            self.roles = [self.guild.default_role, *roles]
+        if nick is not None:
+            self.nick = self.display_name = nick
+
+    async def send(self, content=None, **kwargs):
+        await rest.call('POST /users/@me/channels')
+        await rest.call('POST /channels/{channel_id}/messages')
+
+    async def ban(self, reason=None):
+        await rest.call('PUT /guilds/{guild_id}/bans/{user_id}')
+
+class FakeMessage:
+    def __init__(self, channel, author, content='', embeds=(), view=None):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = list(embeds)
+        self.view = view
+        self.created_at = datetime.now(timezone.utc)
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id, name, category_id=None, overwrites=None):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.category_id = category_id
+        self.overwrites = overwrites or {}
+        self.messages = []
+        self.created_at = datetime.now(timezone.utc)
+
+    @property
+    def mention(self):
+        return f'<#{self.id}>'
+
+    async def receive(self, message):
+        """Entrega a mensagem como faria o gateway (MESSAGE_CREATE -> on_message)"""
+        self.messages.append(message)
+        await antlove.on_message(message)
+        return message
+
+    async def send(self, content=None, *, embed=None, view=None, file=None):
+        await rest.call('POST /channels/{channel_id}/messages')
+        embeds = [embed] if embed else []
+        return await self.receive(FakeMessage(self, self.guild.me, content or '', embeds, view))
+
+    async def set_permissions(self, target, **permissions):
+        await rest.call('PUT /channels/{channel_id}/permissions/{overwrite_id}')
+        self.overwrites[target] = permissions
+
+    async def edit(self, *, name=None):
+        await rest.call('PATCH /channels/{channel_id}')
+        if name is not None:
+            self.name = name
+
+    async def delete(self):
+        await rest.call('DELETE /channels/{channel_id}')
+        self.guild.channels.pop(self.id, None)
+        await antlove.on_guild_channel_delete(self)
+
+    async def history(self, limit=None, after=None, before=None, oldest_first=True):
+        after_id = after.id if after else 0
+        before_id = before.id if before else None
+        selected = [m for m in self.messages if m.id > after_id and (before_id is None or m.id < before_id)]
+        # Uma requisição a cada página de 100 mensagens
+        for start in range(0, max(len(selected), 1), 100):
+            await rest.call('GET /channels/{channel_id}/messages')
+            for message in selected[start:start + 100]:
+                yield message
+
+class FakeDMChannel:
+    """Canal de mensagem direta: sem nome e sem servidor"""
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.guild = None
+
+class FakeCategory:
+    def __init__(self, guild, category_id, name):
+        self.guild = guild
+        self.id = category_id
+        self.name = name
+
+    @property
+    def text_channels(self):
+        return [c for c in self.guild.channels.values() if getattr(c, 'category_id', None) == self.id]
+
+    async def create_text_channel(self, name, overwrites=None):
+        await rest.call('POST /guilds/{guild_id}/channels')
+        channel = FakeTextChannel(self.guild, next_id(), name, category_id=self.id, overwrites=overwrites)
+        self.guild.channels[channel.id] = channel
+        return channel
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.channels = {}
+        self.role_map = {}
+        self.members = {}
+        self.default_role = self.add_role(guild_id, '@everyone')
+        self.me = self.add_member('AntLove Bot')
+        self.me.bot = True
+
+    @property
+    def roles(self):
+        return sorted(self.role_map.values(), key=lambda role: role.position)
+
+    def add_role(self, role_id, name, administrator=False):
+        role = FakeRole(self, role_id, name, administrator, position=len(self.role_map))
+        self.role_map[role_id] = role
+        return role
+
+    def add_member(self, name, roles=(), administrator=False):
+        member = FakeMember(self, next_id(), name, roles, administrator)
+        self.members[member.id] = member
+        return member
+
+    def get_role(self, role_id):
+        return self.role_map.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    async def fetch_member(self, member_id):
+        await rest.call('GET /guilds/{guild_id}/members/{user_id}')
+        if member_id not in self.members:
+            raise LookupError('Unknown Member')
+        return self.members[member_id]
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.done = False
+        self.content = None
+        self.embed = None
+        self.view = None
+        self.modal = None
+
+    def is_done(self):
+        return self.done
+
+    async def _respond(self, content=None, embed=None, view=None, modal=None):
+        if self.done:
+            raise RuntimeError('Interação já respondida')
+        await rest.call('POST /interactions/{interaction_id}/{token}/callback')
+        self.done = True
+        self.content, self.embed, self.view, self.modal = content, embed, view, modal
+        self.interaction.changed.set()
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False):
+        await self._respond(content, embed, view)
+
+    async def edit_message(self, *, content=None, embed=None, view=None):
+        await self._respond(content, embed, view)
+
+    async def send_modal(self, modal):
+        await self._respond(modal=modal)
+
+    async def defer(self, *, thinking=False, ephemeral=False):
+        await self._respond()
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.messages = []
+
+    async def send(self, content=None, *, embed=None, ephemeral=False):
+        await rest.call('POST /webhooks/{application_id}/{token}')
+        self.messages.append(content)
+        self.interaction.changed.set()
+
+class FakeInteraction:
+    def __init__(self, user, guild, channel=None, message=None):
+        self.id = next_id()
+        self.application_id = APPLICATION_ID
+        self.token = f'token-{self.id}'
+        self.user = user
+        self.guild = guild
+        self.channel = channel
+        self.channel_id = channel.id if channel else None
+        self.message = message
+        self.edits = []
+        self.changed = asyncio.Event()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+    async def edit_original_response(self, *, content=None, embed=None, view=None):
+        await rest.call('PATCH /webhooks/{application_id}/{token}/messages/@original')
+        self.edits.append(content)
+        self.changed.set()
+
+    async def delete_original_response(self):
+        await rest.call('DELETE /webhooks/{application_id}/{token}/messages/@original')
+
+    async def wait_for(self, predicate, timeout=60):
+        """Espera até predicate() ser verdadeiro (usado para tarefas que rodam na fila)"""
+        async def wait():
+            while not predicate():
+                self.changed.clear()
+                await self.changed.wait()
+        await asyncio.wait_for(wait(), timeout)
+
+# ========== SERVIDOR SIMULADO ==========
+
+class DiscordSimulator:
+    """Servidor falso com os canais e cargos configurados em CONFIG"""
+    def __init__(self, users):
+        config = antlove.CONFIG
+        self.guild = guild = FakeGuild(config["GUILD_ID"])
+        guild.channels[config["TICKET_CATEGORY_ID"]] = FakeCategory(guild, config["TICKET_CATEGORY_ID"], 'Tickets')
+        for channel_id, name in ((config["LOGS_CHANNEL_ID"], 'logs'), (config["ROLE_ADMIN_CHANNEL_ID"], 'cargos-admin')):
+            guild.channels[channel_id] = FakeTextChannel(guild, channel_id, name)
+
+        for i, role_id in enumerate(config["AVAILABLE_ROLES"]):
+            guild.add_role(role_id, f'Cargo {i + 1}')
+        initial_role = guild.add_role(config["AUTO_ROLE_ID"], 'Visitante')
+        admin_role = guild.add_role(next_id(), 'Admin', administrator=True)
+
+        # Cada usuário tem um administrador próprio para não esbarrar no limite de taxa de um único admin
+        self.users = [guild.add_member(f'usuario{i}', roles=[initial_role]) for i in range(users)]
+        self.staff = [guild.add_member(f'admin{i}', roles=[admin_role], administrator=True) for i in range(users)]
+
+async def press(view, item, interaction):
+    """Clique simulado: interaction_check da view e depois o callback do item"""
+    if not await view.interaction_check(interaction):
+        return False
+    await item.callback(interaction)
+    return True
+
+async def submit(modal, interaction, **values):
+    """Envio simulado do modal com os valores dos campos"""
+    for name, value in values.items():
+        getattr(modal, name)._value = value
+    if not await modal.interaction_check(interaction):
+        return False
+    await modal.on_submit(interaction)
+    return True
+
+# ========== FLUXOS ==========
+
+async def ticket_flow(sim, index, messages):
+    user, staff, guild = sim.users[index], sim.staff[index], sim.guild
+    view = antlove.TicketView()
+    if not await press(view, view.create_ticket, FakeInteraction(user, guild)):
+        return False
+    channel = guild.get_channel(antlove.ticket_owners.get((guild.id, user.id)))
+    if channel is None:
+        return False
+
+    for i in range(messages):
+        await channel.receive(FakeMessage(channel, user, f'mensagem {i} do ticket'))
+
+    interaction = FakeInteraction(staff, guild, channel=channel)
+    await antlove.CloseTicketButton(str(channel.id)).close_ticket(interaction)
+    await interaction.wait_for(lambda: interaction.followup.messages or any(
+        edit and edit.startswith('Ticket será fechado') for edit in interaction.edits
+    ))
+    return not interaction.followup.messages
+
+async def role_flow(sim, index):
+    user, staff, guild = sim.users[index], sim.staff[index], sim.guild
+    view = antlove.RoleRequestView()
+    interaction = FakeInteraction(user, guild)
+    if not await press(view, view.request_role, interaction) or interaction.response.view is None:
+        return False
+
+    captcha = interaction.response.view
+    correct = next(item for item in captcha.children if item.label == captcha.captcha_code)
+    interaction = FakeInteraction(user, guild)
+    if not await press(captcha, correct, interaction) or interaction.response.modal is None:
+        return False
+
+    ok = await submit(
+        interaction.response.modal, FakeInteraction(user, guild),
+        recruiter_name='Recrutador', ingame_number=str(1000 + index), rp_name=f'Pessoa {index}', role_choice='1'
+    )
+    request = antlove.role_requests.get_by_user(guild.id, user.id)
+    if not ok or request is None:
+        return False
+
+    # Metade aprovada, metade reprovada
+    admin_message = guild.get_channel(antlove.get_guild_config(guild.id)["ROLE_ADMIN_CHANNEL_ID"]).messages[-1]
+    interaction = FakeInteraction(staff, guild, message=admin_message)
+    if index % 2 == 0:
+        await antlove.ApproveRoleButton(request['request_id']).approve_role(interaction)
+    else:
+        await antlove.DenyRoleButton(request['request_id']).deny_role(interaction)
+    return antlove.role_requests.get(request['request_id']) is None
+
+async def warning_flow(sim, index):
+    user, staff, guild = sim.users[index], sim.staff[index], sim.guild
+    for action in ('add', 'view'):
+        panel = antlove.AdminPanelView()
+        interaction = FakeInteraction(staff, guild)
+        if not await press(panel, panel.warnings_button, interaction) or interaction.response.modal is None:
+            return False
+        modal = interaction.response.modal
+        interaction = FakeInteraction(staff, guild)
+        ok = await submit(
+            modal, interaction,
+            user_input=str(user.id), reason_input='Teste de carga', action_input=action
+        )
+        if not ok or interaction.response.embed is None:
+            return False
+    return True
+
+async def bench_on_message(sim, count):
+    """Custo do on_message por mensagem em cada tipo de canal"""
+    guild, user = sim.guild, sim.users[0]
+    chat = FakeTextChannel(guild, next_id(), 'geral')
+    dm = FakeDMChannel(next_id())
+    ticket = FakeTextChannel(guild, next_id(), f'ticket-{user.name}', category_id=antlove.CONFIG["TICKET_CATEGORY_ID"])
+    ticket_id = str(ticket.id)
+    antlove.index_ticket_channel(ticket, owner_id=user.id)
+    antlove.tickets_data[ticket_id] = {
+        'guild_id': guild.id,
+        'user_id': user.id,
+        'channel_id': ticket.id,
+        'created_at': datetime.now().isoformat(),
+        'messages': antlove.TicketMessageBuffer(),
+        'synced': True,
+        'last_message_id': None,
+        'gap_end': None
+    }
+
+    print(f'\non_message ({count} mensagens por caso)')
+    for name, channel, author in (
+        ('canal comum', chat, user),
+        ('canal comum (bot)', chat, guild.me),
+        ('DM', dm, user),
+        ('ticket', ticket, user),
+    ):
+        messages = [FakeMessage(channel, author, 'mensagem de teste') for _ in range(count)]
+        start = time.perf_counter_ns()
+        for message in messages:
+            await antlove.on_message(message)
+        elapsed = time.perf_counter_ns() - start
+        print(f'  {name:<18} {elapsed / count:>9.0f} ns/mensagem')
+
+    antlove.forget_ticket(ticket_id)
+    antlove.unindex_ticket_channel(ticket.id)
+
+# ========== EXECUÇÃO ==========
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+async def run_flow(name, sim, flow, *args):
+    rest.flow = name
+    latencies = []
+
+    async def timed(index):
+        start = time.perf_counter()
+        try:
+            ok = await flow(sim, index, *args)
+        except Exception as e:
+            print(f'  {name} #{index}: erro {e!r}')
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        return ok
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed(i) for i in range(len(sim.users))))
+    elapsed = time.perf_counter() - start
+
+    ok = sum(results)
+    print(
+        f'{name:<8} {ok:>5}/{len(results):<5} {ok / elapsed:>9.1f}/s '
+        f'{percentile(latencies, 0.5) * 1000:>9.1f}ms {percentile(latencies, 0.99) * 1000:>9.1f}ms '
+        f'{rest.total(name) / max(len(results), 1):>10.1f}'
+    )
+
+async def main(args):
+    rest.latency = args.rest_latency / 1000
+    # Só avisos e erros do bot, para não misturar com a tabela de resultados
+    logging.getLogger('antlove').setLevel(logging.WARNING)
+
+    # Dados do bot (banco, logs, advertências) vão para um diretório temporário
+    os.chdir(tempfile.mkdtemp(prefix='antlove-loadtest-'))
+    antlove.database.open()
+    antlove.warnings_store.load()
+    antlove.database.start()
+    antlove.job_queue.start()
+
+    sim = DiscordSimulator(args.users)
+    print(f'{args.users} usuários, {args.messages} mensagens por ticket, latência REST {args.rest_latency}ms')
+    print(f'{"fluxo":<8} {"ok":>11} {"vazão":>11} {"p50":>11} {"p99":>11} {"REST/fluxo":>10}')
+
+    flows = {
+        'ticket': (ticket_flow, args.messages),
+        'cargo': (role_flow,),
+        'aviso': (warning_flow,),
+    }
+    if args.pool:
+        # Pool de canais criado antes do teste (no bot, a reposição roda em segundo plano)
+        rest.flow = 'pool'
+        antlove.ticket_pool.size = args.pool
+        for _ in range(args.pool):
+            await antlove.ticket_pool.create_channel(sim.guild)
+
+    for name in args.flows.split(','):
+        flow, *flow_args = flows[name]
+        await run_flow(name, sim, flow, *flow_args)
+
+    if args.bench_messages:
+        await bench_on_message(sim, args.bench_messages)
+
+    if args.verbose:
+        for name, routes in rest.calls.items():
+            print(f'\n{name}:')
+            for route, count in sorted(routes.items(), key=lambda item: -item[1]):
+                print(f'  {count:>7}  {route}')
+
+    await antlove.database.flush()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Teste de carga offline do bot')
+    parser.add_argument('--users', type=int, default=100, help='usuários simulados simultâneos')
+    parser.add_argument('--messages', type=int, default=20, help='mensagens enviadas em cada ticket')
+    parser.add_argument('--rest-latency', type=float, default=20, help='latência simulada de cada chamada REST (ms)')
+    parser.add_argument('--flows', default='ticket,cargo,aviso', help='fluxos a executar, separados por vírgula')
+    parser.add_argument('--pool', type=int, default=0, help='canais de ticket criados com antecedência (TICKET_POOL_SIZE)')
+    parser.add_argument('--bench-messages', type=int, default=0, help='mede o custo do on_message com N mensagens por caso')
+    parser.add_argument('--verbose', action='store_true', help='mostra as chamadas REST por rota')
+    asyncio.run(main(parser.parse_args()))